@@ -0,0 +1,310 @@
+"""
+    Load test of the Telecom Service API against a running Odoo instance with somit_telecom installed.
+
+    Seeds consumptions through the batch endpoint, then drives every endpoint concurrently and reports
+    latency percentiles, throughput and, when a database DSN with pg_stat_statements is given, the number
+    of SQL queries per request.
+
+    Usage:
+        python benchmarks/bench_api.py --url http://localhost:8069 --db odoo --login admin --password admin \\
+            --seed 10000 --requests 2000 --workers 8 --output results.json
+        python benchmarks/bench_api.py ... --baseline results.json --max-regression 0.2
+        python benchmarks/bench_api.py ... --scaling 1,2,4,8,16 --requests 2000
+
+    With --scaling, creates are run against the same telecom service with every worker count and the throughput
+    is compared with the single worker one: concurrent ingest should scale instead of waiting on shared rows.
+
+    Warning: it creates, updates and deletes consumptions, do not run it against production data.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+
+API_PATH = '/telecomservice/api/v2'
+HEADERS = {'Content-Type': 'application/json'}
+SEED_BATCH_SIZE = 1000
+ENDPOINTS = ['create', 'get', 'list', 'list_cursor', 'update', 'delete']
+# Endpoints whose requests pick the seeded consumptions
+SEEDED_ENDPOINTS = ['get', 'update', 'delete']
+
+
+class TelecomAPIClient:
+    def __init__(self, url, db, login, password):
+        self.url = url.rstrip('/') + API_PATH
+        self.session = requests.Session()
+        # Bearer tokens avoid the session store on every request
+        token = self._call('POST', '/token', {'db': db, 'login': login, 'password': password})['token']
+        self.session.headers['Authorization'] = 'Bearer %s' % token
+
+    def _call(self, method, path, params):
+        data = json.dumps({'jsonrpc': '2.0', 'params': params})
+        response = self.session.request(method, self.url + path, headers=HEADERS, data=data)
+        response.raise_for_status()
+        payload = response.json()
+        if 'error' in payload:
+            raise RuntimeError(payload['error'].get('data', {}).get('message') or payload['error'])
+        return payload['result']
+
+    def create(self, params):
+        return self._call('POST', '/consumption/create', dict(params, fields=['id']))[0]['id']
+
+    def create_batch(self, consumptions):
+        """
+            Returns the ids of the consumptions created and the errors of the rejected ones
+        """
+        results = self._call('POST', '/consumption/create/batch', {'consumptions': consumptions})
+        return [result['id'] for result in results if result.get('id')], [result['error'] for result in results if not result.get('success')]
+
+    def get(self, consumption_id):
+        return self._call('GET', '/consumption/%s' % consumption_id, {})
+
+    def list(self, params):
+        return self._call('GET', '/consumption/list', params)
+
+    def update(self, consumption_id, params):
+        return self._call('PUT', '/consumption/update/%s' % consumption_id, dict(params, fields=['id']))
+
+    def delete(self, consumption_id):
+        return self._call('DELETE', '/consumption/delete/%s' % consumption_id, {})
+
+
+class SQLCounter:
+    """
+        Count the queries run by the database between two snapshots, requires pg_stat_statements
+    """
+    def __init__(self, dsn):
+        import psycopg2
+        self.connection = psycopg2.connect(dsn)
+        self.connection.autocommit = True
+
+    def snapshot(self):
+        with self.connection.cursor() as cr:
+            cr.execute('SELECT COALESCE(SUM(calls), 0) FROM pg_stat_statements WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())')
+            return cr.fetchone()[0]
+
+
+def random_consumption(args):
+    timestamp = datetime.now() - timedelta(seconds=random.randint(0, 90 * 24 * 3600))
+    return {
+        'telecom_service_name': args.telecom_service_name,
+        'consumption_timestamp': timestamp.isoformat(),
+        'consumption_qty': random.randint(1, 100),
+    }
+
+def seed(client, args):
+    consumption_ids, errors = [], []
+    for start in range(0, args.seed, SEED_BATCH_SIZE):
+        size = min(SEED_BATCH_SIZE, args.seed - start)
+        batch_ids, batch_errors = client.create_batch([random_consumption(args) for _ in range(size)])
+        consumption_ids += batch_ids
+        errors += batch_errors
+    if errors:
+        print('    %s consumptions failed, first error: %s' % (len(errors), errors[0]))
+    return consumption_ids
+
+def build_operations(endpoint, args, consumption_ids):
+    """
+        Get one callable per request of the endpoint, each one receives the worker client
+    """
+    if endpoint == 'create':
+        return [lambda client: client.create(random_consumption(args)) for _ in range(args.requests)]
+    if endpoint == 'get':
+        return [lambda client, i=random.choice(consumption_ids): client.get(i) for _ in range(args.requests)]
+    if endpoint == 'list':
+        return [
+            lambda client, offset=random.randint(0, max(len(consumption_ids) - args.page_size, 0)): client.list({'limit': args.page_size, 'offset': offset})
+            for _ in range(args.requests)
+        ]
+    if endpoint == 'list_cursor':
+        # Each request walks one page further than the previous one of the same worker
+        cursors = {}
+        def next_page(client):
+            page = client.list({'limit': args.page_size, 'pagination': 'cursor', 'cursor': cursors.get(client, False)})
+            cursors[client] = page['next_cursor']
+        return [next_page for _ in range(args.requests)]
+    if endpoint == 'update':
+        return [
+            lambda client, i=random.choice(consumption_ids): client.update(i, {'consumption_qty': random.randint(1, 100)})
+            for _ in range(args.requests)
+        ]
+    if endpoint == 'delete':
+        # Every id can only be deleted once
+        return [lambda client, i=i: client.delete(i) for i in consumption_ids[:args.requests]]
+    raise ValueError(endpoint)
+
+def run_endpoint(endpoint, operations, clients, sql_counter):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    local = threading.local()
+    client_pool = list(clients)
+
+    def execute(operation):
+        if not hasattr(local, 'client'):
+            with lock:
+                local.client = client_pool.pop()
+        start = time.perf_counter()
+        try:
+            operation(local.client)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    queries = sql_counter.snapshot() if sql_counter else None
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        list(executor.map(execute, operations))
+    elapsed = time.perf_counter() - start
+    if sql_counter:
+        queries = (sql_counter.snapshot() - queries) / max(len(operations), 1)
+
+    return {
+        'endpoint': endpoint,
+        'requests': len(operations),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'throughput': len(latencies) / elapsed if elapsed else 0,
+        'sql_queries': queries,
+    }
+
+def percentile(values, percent):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0] * 1000
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1] * 1000
+
+def print_report(results):
+    print('%-12s %8s %7s %9s %9s %9s %10s %9s' % ('endpoint', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'sql/req'))
+    for result in results:
+        print('%-12s %8s %7s %9s %9s %9s %10.1f %9s' % (
+            result['endpoint'], result['requests'], result['errors'],
+            *['%.1f' % result[key] if result[key] is not None else '-' for key in ('p50', 'p95', 'p99')],
+            result['throughput'],
+            '%.1f' % result['sql_queries'] if result['sql_queries'] is not None else '-',
+        ))
+        if result['first_error']:
+            print('    first error: %s' % result['first_error'])
+
+def check_regressions(results, baseline_path, max_regression):
+    """
+        Compare the p95 latency and SQL queries per request with a previous run
+        Returns the list of regressions found
+    """
+    with open(baseline_path) as f:
+        baseline = {result['endpoint']: result for result in json.load(f)}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['endpoint'])
+        if not previous:
+            continue
+        for key in ('p95', 'sql_queries'):
+            if result[key] is None or not previous.get(key):
+                continue
+            if result[key] > previous[key] * (1 + max_regression):
+                regressions.append('%s %s: %.1f -> %.1f' % (result['endpoint'], key, previous[key], result[key]))
+    return regressions
+
+def run_scaling(args):
+    """
+        Run the create endpoint with every worker count, all the workers create consumptions of the same template
+        Returns one result per worker count, with the speedup over the first one
+    """
+    worker_counts = [int(count) for count in args.scaling.split(',')]
+    clients = [TelecomAPIClient(args.url, args.db, args.login, args.password) for _ in range(max(worker_counts))]
+
+    results = []
+    for workers in worker_counts:
+        operations = build_operations('create', args, [])
+        result = run_endpoint('create', operations, clients[:workers], None)
+        result['workers'] = workers
+        result['speedup'] = result['throughput'] / results[0]['throughput'] if results and results[0]['throughput'] else 1.0
+        results.append(result)
+    return results
+
+def print_scaling_report(results):
+    print('%7s %8s %7s %9s %10s %8s' % ('workers', 'requests', 'errors', 'p95 ms', 'req/s', 'speedup'))
+    for result in results:
+        print('%7s %8s %7s %9s %10.1f %7.2fx' % (
+            result['workers'], result['requests'], result['errors'],
+            '%.1f' % result['p95'] if result['p95'] is not None else '-',
+            result['throughput'], result['speedup'],
+        ))
+        if result['first_error']:
+            print('    first error: %s' % result['first_error'])
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Telecom Service API load test')
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--login', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--telecom-service-name', default='Mobile data')
+    parser.add_argument('--seed', type=int, default=10000, help='Consumptions created before the run')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per endpoint')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--dsn', help='Database DSN to count queries with pg_stat_statements')
+    parser.add_argument('--output', help='Save the results as JSON')
+    parser.add_argument('--baseline', help='Results of a previous run to check for regressions')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    parser.add_argument('--scaling', help='Worker counts of the concurrent create stress test, e.g. 1,2,4,8')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    random.seed(0)
+
+    if args.scaling:
+        results = run_scaling(args)
+        print_scaling_report(results)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        return
+
+    clients = [TelecomAPIClient(args.url, args.db, args.login, args.password) for _ in range(args.workers)]
+    sql_counter = SQLCounter(args.dsn) if args.dsn else None
+
+    print('Seeding %s consumptions' % args.seed)
+    consumption_ids = seed(clients[0], args)
+    endpoints = args.endpoints.split(',')
+    if not consumption_ids and set(endpoints) & set(SEEDED_ENDPOINTS):
+        sys.exit('No consumption was seeded, the %s endpoints need some' % ', '.join(SEEDED_ENDPOINTS))
+
+    results = []
+    for endpoint in endpoints:
+        operations = build_operations(endpoint, args, consumption_ids)
+        results.append(run_endpoint(endpoint, operations, clients, sql_counter))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        regressions = check_regressions(results, args.baseline, args.max_regression)
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
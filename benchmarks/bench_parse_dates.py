@@ -0,0 +1,100 @@
+"""
+    Micro-benchmark of commons.utils.parse_dates against the dateutil only parser it replaced.
+    It does not need an Odoo instance, run it with: python benchmarks/bench_parse_dates.py [size]
+"""
+import importlib.util
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from dateutil.parser import parse
+
+
+UTILS_PATH = os.path.join(os.path.dirname(__file__), '..', 'somit_telecom', 'commons', 'utils.py')
+DEFAULT_SIZE = 1000000
+
+
+def load_utils():
+    # Load the module from its path, importing the addon package would require Odoo
+    spec = importlib.util.spec_from_file_location('somit_telecom_utils', UTILS_PATH)
+    utils = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(utils)
+    return utils
+
+def legacy_parse_dates(date):
+    """
+        parse_dates as it was before the fast paths were added
+    """
+    if not date:
+        return False
+    if isinstance(date, datetime):
+        return date
+    if isinstance(date, str):
+        try:
+            parsed_date = parse(date)
+        except ValueError:
+            parsed_date = False
+        if not parsed_date:
+            try:
+                parsed_date = datetime.fromtimestamp(int(date))
+            except ValueError:
+                parsed_date = False
+    elif isinstance(date, int):
+        try:
+            parsed_date = datetime.fromtimestamp(date)
+        except ValueError:
+            parsed_date = False
+    else:
+        return False
+    return parsed_date
+
+def generate_dates(size):
+    """
+        Mixed formats as sent by the collectors: ISO strings, unix timestamps (int and str),
+        day first dates (ambiguous when the day is 12 or lower) and some datetimes already parsed
+        by the validation layer
+    """
+    random.seed(0)
+    start = datetime(2020, 1, 1)
+    dates = []
+    for _ in range(size):
+        date = start + timedelta(seconds=random.randint(0, 4 * 365 * 24 * 3600))
+        kind = random.randint(0, 5)
+        if kind == 0:
+            dates.append(date.isoformat())
+        elif kind == 1:
+            dates.append(date.strftime('%Y-%m-%d %H:%M:%S'))
+        elif kind == 2:
+            dates.append(int(date.timestamp()))
+        elif kind == 3:
+            dates.append(str(int(date.timestamp())))
+        elif kind == 4:
+            dates.append(date.strftime('%d/%m/%Y %H:%M:%S'))
+        else:
+            dates.append(date)
+    return dates
+
+def run(name, parser, dates, **kwargs):
+    start = time.perf_counter()
+    results = [parser(date, **kwargs) for date in dates]
+    elapsed = time.perf_counter() - start
+    print('%-12s %8.2f s %10.0f dates/s' % (name, elapsed, len(dates) / elapsed))
+    return results
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE
+    utils = load_utils()
+    dates = generate_dates(size)
+
+    print('Parsing %s mixed format dates' % size)
+    legacy = run('legacy', legacy_parse_dates, dates)
+    current = run('parse_dates', utils.parse_dates, dates, client=1)
+
+    mismatches = sum(1 for a, b in zip(legacy, current) if a != b)
+    print('Mismatching results: %s' % mismatches)
+
+
+if __name__ == '__main__':
+    main()
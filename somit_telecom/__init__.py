@@ -1,3 +1,4 @@
 from . import models
 from . import controllers
-from . import services
\ No newline at end of file
+from . import services
+from . import cli
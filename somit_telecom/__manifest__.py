@@ -3,7 +3,7 @@
 ##############################################################################
 {
     "name": "Som IT Telecom Custom Addons",
-    "version": "16.0.1.0.0",
+    "version": "16.0.1.1.0",
     "description": """
         - Custom Addons for Som IT Telecom Management Module
     """,
@@ -16,7 +16,10 @@
     "data": [
         "security/ir.model.access.csv",
         "data/product_data.xml",
+        "data/ir_cron.xml",
         "views/telecom_service_consumption_views.xml",
+        "views/telecom_service_consumption_daily_views.xml",
+        "views/product_template_views.xml",
     ],
     "demo": [
         'demo/demo_consumptions.xml',
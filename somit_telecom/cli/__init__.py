@@ -0,0 +1,2 @@
+from . import import_consumptions
+from . import recompute_usage_counters
@@ -0,0 +1,56 @@
+import csv
+import logging
+import optparse
+import sys
+
+import odoo
+from odoo.cli import Command
+
+from ..services.import_service import IMPORT_FORMATS, IMPORT_CHUNK_SIZE
+
+
+_logger = logging.getLogger(__name__)
+
+
+class ImportConsumptions(Command):
+    """
+        Import telecom service consumptions from a CSV or Parquet file (historical backfills)
+        Usage: odoo-bin import_consumptions -c odoo.conf -d db --file consumptions.csv
+    """
+    name = 'import_consumptions'
+
+    def run(self, cmdargs):
+        parser = odoo.tools.config.parser
+        parser.prog = '%s %s' % (sys.argv[0].split('/')[-1], self.name)
+        group = optparse.OptionGroup(parser, 'Import Configuration')
+        group.add_option('--file', dest='import_file', help='CSV or Parquet file to import')
+        group.add_option(
+            '--format', dest='import_format', type='choice', choices=IMPORT_FORMATS,
+            help='File format, guessed from the file extension by default'
+        )
+        group.add_option('--chunk-size', dest='import_chunk_size', type='int', default=IMPORT_CHUNK_SIZE, help='Rows per transaction')
+        group.add_option('--company-id', dest='import_company_id', type='int', help='Company of the rows without company_id')
+        group.add_option('--errors-file', dest='import_errors_file', help='CSV file where the rejected rows are written')
+        parser.add_option_group(group)
+        opt = odoo.tools.config.parse_config(cmdargs)
+
+        if not opt.import_file:
+            parser.error('--file is required')
+        dbname = odoo.tools.config['db_name']
+        if not dbname:
+            parser.error('--database is required')
+        file_format = opt.import_format or ('parquet' if opt.import_file.endswith('.parquet') else 'csv')
+
+        registry = odoo.registry(dbname)
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            imported, errors = env['telecom.consumption.import'].import_file(
+                opt.import_file, file_format, opt.import_chunk_size, opt.import_company_id
+            )
+
+        if opt.import_errors_file:
+            with open(opt.import_errors_file, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['row', 'error'])
+                writer.writerows(errors)
+        _logger.info('Imported %s consumptions, %s rows rejected', imported, len(errors))
@@ -0,0 +1,40 @@
+import logging
+import optparse
+import sys
+
+import odoo
+from odoo.cli import Command
+
+
+_logger = logging.getLogger(__name__)
+
+
+class RecomputeUsageCounters(Command):
+    """
+        Recompute the usage counters of the telecom service templates (repairs)
+        Usage: odoo-bin recompute_usage_counters -c odoo.conf -d db [--rebuild-daily]
+    """
+    name = 'recompute_usage_counters'
+
+    def run(self, cmdargs):
+        parser = odoo.tools.config.parser
+        parser.prog = '%s %s' % (sys.argv[0].split('/')[-1], self.name)
+        group = optparse.OptionGroup(parser, 'Recompute Configuration')
+        group.add_option(
+            '--rebuild-daily', dest='rebuild_daily', action='store_true', default=False,
+            help='Rebuild the daily totals from the consumptions first, the days emptied by the retention are kept'
+        )
+        parser.add_option_group(group)
+        opt = odoo.tools.config.parse_config(cmdargs)
+
+        dbname = odoo.tools.config['db_name']
+        if not dbname:
+            parser.error('--database is required')
+
+        registry = odoo.registry(dbname)
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            if opt.rebuild_daily:
+                env['telecom.service.consumption.daily'].rebuild()
+            env['product.template']._recompute_usage_counters()
+        _logger.info('Usage counters recomputed')
@@ -0,0 +1,133 @@
+import io
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Compression Constants
+# Paths of the API whose request and response bodies can be compressed
+API_PATH = '/telecomservice/api/v2/'
+# Smaller responses are not worth the CPU, they fit in a few packets anyway
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# Decompressed request bodies are limited to protect the workers against decompression bombs
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+# Compression Messages
+UNSUPPORTED_ENCODING_MSG = 'Unsupported Content-Encoding %s. Supported encodings: %s.'
+INVALID_BODY_MSG = 'Invalid %s request body.'
+BODY_TOO_LARGE_MSG = 'The decompressed request body exceeds %s bytes.'
+
+
+def get_encodings():
+    """
+        Get the supported encodings, by order of preference (zstd needs the zstandard library)
+    """
+    return ['zstd', 'gzip'] if zstandard else ['gzip']
+
+def is_api_request(httprequest):
+    return httprequest.path.startswith(API_PATH)
+
+def negotiate(accept_encoding):
+    """
+        Pick the preferred supported encoding of an Accept-Encoding header, False if none is accepted
+        params: Accept-Encoding header value
+    """
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        encoding, _sep, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if encoding:
+            accepted[encoding.strip().lower()] = quality
+
+    for encoding in get_encodings():
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return False
+
+def encode_etag(etag, encoding):
+    """
+        Get the strong ETag of a response compressed with the given encoding
+        HTTP requires a different strong ETag for each content coding of the same response
+    """
+    return '"%s-%s"' % (etag.strip('"'), encoding)
+
+def match_etag(etag, if_none_match):
+    """
+        Get the tag of an If-None-Match header matching the ETag of an uncompressed response, False if none matches
+        Tags match weakly and in any content coding (see encode_etag)
+        params: ETag of the uncompressed response, If-None-Match header value
+    """
+    etags = [etag] + [encode_etag(etag, encoding) for encoding in get_encodings()]
+    for tag in (tag.strip() for tag in (if_none_match or '').split(',')):
+        if tag == '*':
+            return etag
+        if (tag[2:] if tag.startswith('W/') else tag) in etags:
+            return tag
+    return False
+
+def compressor(encoding):
+    """
+        Get a streaming compressor (compress(data) and flush() methods) for the given encoding
+    """
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    # wbits=31: gzip container
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+def compress(data, encoding):
+    stream = compressor(encoding)
+    return stream.compress(data) + stream.flush()
+
+def compress_stream(chunks, encoding):
+    """
+        Compress an iterable of str or bytes chunks as they are produced
+    """
+    stream = compressor(encoding)
+    for chunk in chunks:
+        data = stream.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield stream.flush()
+
+def decompress(data, encoding):
+    """
+        Decompress a request body, raise ValueError if the encoding is not supported, the body
+        is invalid or it exceeds MAX_DECOMPRESSED_SIZE once decompressed
+        params: compressed body, Content-Encoding header value
+    """
+    encoding = (encoding or '').strip().lower()
+    if encoding in ('', 'identity'):
+        return data
+    if encoding not in get_encodings():
+        raise ValueError(UNSUPPORTED_ENCODING_MSG % (encoding, ', '.join(get_encodings())))
+
+    if encoding == 'zstd':
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+                body = reader.read(MAX_DECOMPRESSED_SIZE + 1)
+        except zstandard.ZstdError:
+            raise ValueError(INVALID_BODY_MSG % encoding)
+    else:
+        stream = zlib.decompressobj(31)
+        try:
+            body = stream.decompress(data, MAX_DECOMPRESSED_SIZE + 1)
+        except zlib.error:
+            raise ValueError(INVALID_BODY_MSG % encoding)
+        if not stream.eof and len(body) <= MAX_DECOMPRESSED_SIZE:
+            # Truncated body
+            raise ValueError(INVALID_BODY_MSG % encoding)
+
+    if len(body) > MAX_DECOMPRESSED_SIZE:
+        raise ValueError(BODY_TOO_LARGE_MSG % MAX_DECOMPRESSED_SIZE)
+    return body
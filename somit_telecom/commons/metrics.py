@@ -0,0 +1,176 @@
+import functools
+import hmac
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from odoo.http import request
+from odoo.tools import str2bool
+
+
+_logger = logging.getLogger(__name__)
+
+
+# Metrics Settings (ir.config_parameter)
+METRICS_ENABLED_PARAM = 'somit_telecom.metrics_enabled'
+METRICS_LOG_PARAM = 'somit_telecom.metrics_log'
+# Shared secret of the metrics scraper, the metrics route is disabled while it is not set
+METRICS_TOKEN_PARAM = 'somit_telecom.metrics_token'
+
+# Metrics Constants
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+LOG_MSG = 'telecom_api_metrics %s'
+
+# Metrics by (operation, phase), they are kept per process
+_lock = threading.Lock()
+_metrics = {}
+# Operations being measured by the current thread, phases are labeled with the innermost one
+_operations = threading.local()
+
+
+def is_enabled(env):
+    """
+        Check if the instrumentation is enabled, get_param is cached so it does not query the database
+    """
+    return str2bool(env['ir.config_parameter'].sudo().get_param(METRICS_ENABLED_PARAM, 'False'))
+
+def is_authorized(env, authorization):
+    """
+        Check the Authorization header of a metrics request against the metrics token
+        The client address is not enough: behind a local reverse proxy every client looks local.
+    """
+    token = env['ir.config_parameter'].sudo().get_param(METRICS_TOKEN_PARAM)
+    if not token or not authorization:
+        return False
+    return hmac.compare_digest(authorization.encode(), ('Bearer %s' % token).encode())
+
+def _sql_counters(env):
+    """
+        Get the number of queries and the SQL time spent so far by the current thread
+        Outside of HTTP requests only the queries of the cursor are counted
+    """
+    thread = threading.current_thread()
+    if hasattr(thread, 'query_count'):
+        return thread.query_count, getattr(thread, 'query_time', 0.0)
+    return env.cr.sql_log_count, 0.0
+
+def _record(operation, phase, duration, sql_count, sql_time):
+    with _lock:
+        metric = _metrics.setdefault((operation, phase), {
+            'count': 0,
+            'duration': 0.0,
+            'buckets': [0] * len(DURATION_BUCKETS),
+            'sql_count': 0,
+            'sql_time': 0.0,
+        })
+        metric['count'] += 1
+        metric['duration'] += duration
+        metric['sql_count'] += sql_count
+        metric['sql_time'] += sql_time
+        for index, bucket in enumerate(DURATION_BUCKETS):
+            if duration <= bucket:
+                metric['buckets'][index] += 1
+
+def _current_operation():
+    stack = getattr(_operations, 'stack', None)
+    return stack[-1] if stack else 'unknown'
+
+@contextmanager
+def measure(env, phase, operation=None, flush=False):
+    """
+        Measure the wall time, SQL queries and SQL time of a block of code
+        params: env, phase label, operation label (defaults to the operation being measured),
+                flush pending ORM writes at the end of the block
+    """
+    if not is_enabled(env):
+        yield
+        return
+
+    operation = operation or _current_operation()
+    sql_count, sql_time = _sql_counters(env)
+    start = time.perf_counter()
+    try:
+        yield
+        if flush:
+            env.flush_all()
+    finally:
+        duration = time.perf_counter() - start
+        end_sql_count, end_sql_time = _sql_counters(env)
+        _record(operation, phase, duration, end_sql_count - sql_count, end_sql_time - sql_time)
+        if str2bool(env['ir.config_parameter'].sudo().get_param(METRICS_LOG_PARAM, 'False')):
+            _logger.info(LOG_MSG, json.dumps({
+                'operation': operation,
+                'phase': phase,
+                'duration': round(duration, 6),
+                'sql_count': end_sql_count - sql_count,
+                'sql_time': round(end_sql_time - sql_time, 6),
+            }))
+
+def _instrument(method, phase, get_env):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not hasattr(_operations, 'stack'):
+            _operations.stack = []
+        _operations.stack.append(method.__name__)
+        try:
+            with measure(get_env(self), phase, method.__name__):
+                return method(self, *args, **kwargs)
+        finally:
+            _operations.stack.pop()
+    return wrapper
+
+def instrument(method):
+    """
+        Measure a telecom.api.service method as a whole (phase 'total')
+    """
+    return _instrument(method, 'total', lambda self: self.env)
+
+def instrument_route(method):
+    """
+        Measure a controller route as a whole (phase 'route')
+    """
+    return _instrument(method, 'route', lambda self: request.env)
+
+def instrument_phase(phase):
+    """
+        Measure a helper method as a phase (validation, write, read...) of the current operation
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with measure(self.env, phase):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def render():
+    """
+        Render the metrics of this process in the Prometheus text format
+    """
+    with _lock:
+        metrics = sorted((key, dict(metric, buckets=list(metric['buckets']))) for key, metric in _metrics.items())
+
+    lines = [
+        '# HELP telecom_api_duration_seconds Wall time of the telecom API operations.',
+        '# TYPE telecom_api_duration_seconds histogram',
+    ]
+    for (operation, phase), metric in metrics:
+        labels = 'operation="%s",phase="%s"' % (operation, phase)
+        for bucket, count in zip(DURATION_BUCKETS, metric['buckets']):
+            lines.append('telecom_api_duration_seconds_bucket{%s,le="%s"} %s' % (labels, bucket, count))
+        lines.append('telecom_api_duration_seconds_bucket{%s,le="+Inf"} %s' % (labels, metric['count']))
+        lines.append('telecom_api_duration_seconds_sum{%s} %s' % (labels, metric['duration']))
+        lines.append('telecom_api_duration_seconds_count{%s} %s' % (labels, metric['count']))
+
+    for name, key, description in [
+        ('telecom_api_sql_queries_total', 'sql_count', 'SQL queries run by the telecom API operations.'),
+        ('telecom_api_sql_duration_seconds_total', 'sql_time', 'SQL time spent by the telecom API operations.'),
+    ]:
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s counter' % name)
+        for (operation, phase), metric in metrics:
+            lines.append('%s{operation="%s",phase="%s"} %s' % (name, operation, phase, metric[key]))
+
+    return '\n'.join(lines) + '\n'
@@ -2,6 +2,35 @@ from dateutil.parser import parse
 from datetime import datetime
 
 
+# Date Constants
+# Formats tried against strings dateutil had to parse, to learn the format each client sends
+KNOWN_DATE_FORMATS = [
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+    '%Y/%m/%d',
+    '%d-%m-%Y %H:%M:%S',
+    '%d-%m-%Y %H:%M',
+    '%d-%m-%Y',
+    '%d.%m.%Y %H:%M:%S',
+    '%d.%m.%Y',
+    '%a, %d %b %Y %H:%M:%S',
+    '%d %b %Y %H:%M:%S',
+    '%b %d %Y %H:%M:%S',
+    '%b %d, %Y %H:%M:%S',
+]
+LEARNED_FORMATS_PER_CLIENT = 4
+LEARNED_FORMATS_CLIENTS = 1024
+
+# Learned formats by client, most recently used first
+_learned_formats = {}
+
+
 # Date Utils
 def str2utc(date):
     """
@@ -16,7 +45,7 @@ def str2utc(date):
 
 def unix2utc(date):
     """
-        Transform unix timestamp to readable date 
+        Transform unix timestamp to readable date
         params: date timestamp
     """
     try:
@@ -25,22 +54,94 @@ def unix2utc(date):
         return False
     return date
 
-def parse_dates(date):
+def iso2utc(date):
+    """
+        Transform an ISO-8601 str date to datetime
+        params: date string
+    """
+    try:
+        date = datetime.fromisoformat(date)
+    except ValueError:
+        return False
+    return date
+
+def _is_epoch_str(date):
+    """
+        Check if a str date looks like a unix timestamp in seconds.
+        Shorter digit strings are left to dateutil, which reads them as days, years or YYMMDD dates.
+    """
+    return date.isdigit() and 9 <= len(date) <= 11
+
+def _learn_format(date, parsed_date, client):
+    """
+        Remember the format of a str date parsed by dateutil for the given client
+        params: date string, parsed date, client key
+    """
+    for date_format in KNOWN_DATE_FORMATS:
+        try:
+            if datetime.strptime(date, date_format) != parsed_date:
+                continue
+        except ValueError:
+            continue
+
+        formats = [date_format] + [f for f in _learned_formats.get(client, []) if f != date_format]
+        if client not in _learned_formats and len(_learned_formats) >= LEARNED_FORMATS_CLIENTS:
+            _learned_formats.clear()
+        _learned_formats[client] = formats[:LEARNED_FORMATS_PER_CLIENT]
+        return
+
+def _is_ambiguous(date_format, parsed_date):
+    """
+        Check if a date parsed with a day first format could be read month first.
+        dateutil reads these dates month first, they are left to it so that learned formats never
+        change the result (05/03/2021 is always May 3rd, even after 13/03/2021 taught %d/%m/%Y).
+        params: date format, parsed date
+    """
+    if '%d' not in date_format or '%m' not in date_format or date_format.index('%d') > date_format.index('%m'):
+        return False
+    return parsed_date.day <= 12 and parsed_date.day != parsed_date.month
+
+def _parse_learned_format(date, client):
+    """
+        Parse a str date with the formats already learned for the given client
+        params: date string, client key
+    """
+    for date_format in _learned_formats.get(client, []):
+        try:
+            parsed_date = datetime.strptime(date, date_format)
+        except ValueError:
+            continue
+        if _is_ambiguous(date_format, parsed_date):
+            return False
+        return parsed_date
+    return False
+
+def parse_dates(date, client=None):
     """
         Parse date to unix timestamp
-        params: date
+        Cheap parsers are tried first (ISO-8601, unix timestamps and the formats learned for
+        the client), dateutil is only used when none of them matches.
+        params: date, client key used to learn the formats it sends
     """
     # Check if date is empty
     if not date:
         return False
-    
+
     # Check if date is already a datetime object
     if isinstance(date, datetime):
         return date
-    
+
     # Try to parse date by any means possible
     if isinstance(date, str):
-        parsed_date = str2utc(date)
+        parsed_date = iso2utc(date)
+        if not parsed_date and _is_epoch_str(date):
+            parsed_date = unix2utc(date)
+        if not parsed_date:
+            parsed_date = _parse_learned_format(date, client)
+        if not parsed_date:
+            parsed_date = str2utc(date)
+            if parsed_date:
+                _learn_format(date, parsed_date, client)
         # Check if date was already a timestamp
         if not parsed_date:
             parsed_date = unix2utc(date)
@@ -48,5 +149,5 @@ def parse_dates(date):
         parsed_date = unix2utc(date)
     else:
         return False
-    
+
     return parsed_date
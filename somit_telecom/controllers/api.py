@@ -1,10 +1,11 @@
 import logging
 from datetime import datetime
 
-from odoo import http
+from odoo import http, api
 from odoo.http import request
 from odoo.exceptions import AccessDenied, UserError
 
+from ..commons import compression, metrics
 from ..commons.utils import parse_dates
 
 
@@ -14,6 +15,12 @@ _logger = logging.getLogger(__name__)
 # API Constants
 SERVICE_CONSUMPTIONS_LIMIT = 100
 
+# API Export
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
 # API Model
 WRITEABLE_FIELDS = ['product_tmpl_id', 'company_id', 'consumption_timestamp', 'consumption_qty'] 
 
@@ -21,11 +28,47 @@ WRITEABLE_FIELDS = ['product_tmpl_id', 'company_id', 'consumption_timestamp', 'c
 LOGGING_MSG = 'User %s successfully authenticated'
 LOGGING_FAILED_MSG = 'Authentication failed for user %s'
 LOGOUT_MSG = 'User successfully logged out'
+TOKEN_MSG = 'Token issued for user %s'
+EXPORT_MSG = 'User %s exporting consumptions as %s'
 
 # API Access Messages
 ACCESS_DENIED_MSG = 'Authentication failed. Check your credentials or contact the system administrator.'
 
-class TelecomServiceAPIV2(http.Controller):        
+# API Validation Messages
+INVALID_LIMIT_MSG = 'Invalid limit provided. The limit must be a number between 1 and %s.'
+
+class TelecomServiceAPIV2(http.Controller):
+    def _validate_list_limit(self, kwargs):
+        """
+            Validate the page size of list requests against SERVICE_CONSUMPTIONS_LIMIT
+        """
+        try:
+            limit = int(kwargs.get('limit', 10))
+        except:
+            raise UserError(INVALID_LIMIT_MSG % SERVICE_CONSUMPTIONS_LIMIT)
+        if limit <= 0 or limit > SERVICE_CONSUMPTIONS_LIMIT:
+            raise UserError(INVALID_LIMIT_MSG % SERVICE_CONSUMPTIONS_LIMIT)
+
+        kwargs['limit'] = limit
+
+    def _get_conditional_params(self, kwargs):
+        """
+            Get the ETag parameters of a read from the request headers, never from the client params
+        """
+        kwargs.pop('if_none_match', None)
+        kwargs.pop('with_etag', None)
+        return {'if_none_match': request.httprequest.headers.get('If-None-Match'), 'with_etag': True}
+
+    def _conditional_response(self, etag, result):
+        """
+            Send the ETag of a read, a None result means the client copy is still valid (304 Not Modified)
+        """
+        request.future_response.headers['ETag'] = etag
+        if result is None:
+            # Turned into an empty 304 response by ir.http._post_dispatch
+            request.telecom_not_modified = True
+        return result
+
     @http.route('/telecomservice/api/v2/authenticate', type='json', auth='none', methods=['POST'])
     def authenticate(self, **kwargs):
         db = kwargs.get('db', request.env.cr.dbname)
@@ -41,28 +84,125 @@ class TelecomServiceAPIV2(http.Controller):
             _logger.error(LOGGING_FAILED_MSG, login)
             raise AccessDenied(message=ACCESS_DENIED_MSG)
         
-    @http.route('/telecomservice/api/v2/logout', type='json', auth='user', methods=['POST'])
+    @http.route('/telecomservice/api/v2/token', type='json', auth='none', methods=['POST'])
+    def get_token(self, **kwargs):
+        db = kwargs.get('db', request.env.cr.dbname)
+        login = kwargs.get('login', False)
+        password = kwargs.get('password', False)
+
+        # The password is only checked here, the token is then verified without it nor a session
+        try:
+            uid = request.env['res.users'].authenticate(db, login, password, {'interactive': False})
+        except:
+            _logger.error(LOGGING_FAILED_MSG, login)
+            raise AccessDenied(message=ACCESS_DENIED_MSG)
+
+        _logger.info(TOKEN_MSG, login)
+        return request.env['telecom.api.token'].sudo().generate_token(uid)
+
+    @http.route('/telecomservice/api/v2/logout', type='json', auth='telecom_token', methods=['POST'])
     def logout(self, **kwargs):
+        # Logging out with a bearer token revokes that token only, the other clients of the user keep theirs
+        authorization = request.httprequest.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            request.env['telecom.api.token'].sudo().revoke_token(authorization[len('Bearer '):].strip())
         request.session.logout()
         _logger.info(LOGOUT_MSG)
         return True
 
-    @http.route('/telecomservice/api/v2/consumption/create', type='json', auth='user', methods=['POST'])
+    @http.route('/telecomservice/api/v2/consumption/create', type='json', auth='telecom_token', methods=['POST'])
+    @metrics.instrument_route
     def create_consumption(self, **kwargs):
         return request.env['telecom.api.service'].create_consumption(**kwargs)
+
+    @http.route('/telecomservice/api/v2/consumption/create/batch', type='json', auth='telecom_token', methods=['POST'])
+    @metrics.instrument_route
+    def create_consumption_batch(self, **kwargs):
+        return request.env['telecom.api.service'].create_consumption_batch(kwargs.get('consumptions', []))
         
-    @http.route('/telecomservice/api/v2/consumption/<int:id>', type='json', auth='user', methods=['GET'])
+    @http.route('/telecomservice/api/v2/consumption/create/async', type='json', auth='telecom_token', methods=['POST'])
+    @metrics.instrument_route
+    def create_consumption_async(self, **kwargs):
+        return request.env['telecom.api.service'].create_consumption_async(kwargs.get('consumptions', []))
+
+    @http.route('/telecomservice/api/v2/consumption/ticket/<string:ticket>', type='json', auth='telecom_token', methods=['GET'])
+    @metrics.instrument_route
+    def get_ticket_status(self, ticket, **kwargs):
+        return request.env['telecom.api.service'].get_ticket_status(ticket)
+
+    @http.route('/telecomservice/api/v2/consumption/<int:id>', type='json', auth='telecom_token', methods=['GET'])
+    @metrics.instrument_route
     def get_consumption(self, id, **kwargs):
-        return request.env['telecom.api.service'].get_consumption(id)
+        conditional_params = self._get_conditional_params(kwargs)
+        etag, result = request.env['telecom.api.service'].get_consumption(id, **conditional_params, **kwargs)
+        return self._conditional_response(etag, result)
     
-    @http.route('/telecomservice/api/v2/consumption/list', type='json', auth='user', methods=['GET'])
+    @http.route('/telecomservice/api/v2/consumption/list', type='json', auth='telecom_token', methods=['GET'])
+    @metrics.instrument_route
     def list_consumptions(self, **kwargs):
-        return request.env['telecom.api.service'].get_consumption_list(**kwargs)
+        self._validate_list_limit(kwargs)
+        conditional_params = self._get_conditional_params(kwargs)
+        etag, result = request.env['telecom.api.service'].get_consumption_list(**conditional_params, **kwargs)
+        return self._conditional_response(etag, result)
     
-    @http.route('/telecomservice/api/v2/consumption/update/<int:id>', type='json', auth='user', methods=['PUT'])
+    @http.route('/telecomservice/api/v2/consumption/aggregate', type='json', auth='telecom_token', methods=['GET'])
+    @metrics.instrument_route
+    def aggregate_consumptions(self, **kwargs):
+        return request.env['telecom.api.service'].get_consumption_totals(**kwargs)
+
+    @http.route('/telecomservice/api/v2/consumption/update/<int:id>', type='json', auth='telecom_token', methods=['PUT'])
+    @metrics.instrument_route
     def update_consumption(self, id, **kwargs):
         return request.env['telecom.api.service'].update_consumption(id, **kwargs)
     
-    @http.route('/telecomservice/api/v2/consumption/delete/<int:id>', type='json', auth='user', methods=['DELETE'])
+    @http.route('/telecomservice/api/v2/consumption/update/batch', type='json', auth='telecom_token', methods=['PUT'])
+    @metrics.instrument_route
+    def update_consumptions(self, **kwargs):
+        return request.env['telecom.api.service'].update_consumptions(
+            kwargs.get('ids', False), kwargs.get('filters', False), kwargs.get('values', False)
+        )
+
+    @http.route('/telecomservice/api/v2/consumption/delete/batch', type='json', auth='telecom_token', methods=['DELETE'])
+    @metrics.instrument_route
+    def delete_consumptions(self, **kwargs):
+        return request.env['telecom.api.service'].delete_consumptions(kwargs.get('ids', False), kwargs.get('filters', False))
+
+    @http.route('/telecomservice/api/v2/consumption/delete/<int:id>', type='json', auth='telecom_token', methods=['DELETE'])
+    @metrics.instrument_route
     def delete_consumption(self, id, **kwargs):
-        return request.env['telecom.api.service'].delete_consumption(id)
\ No newline at end of file
+        return request.env['telecom.api.service'].delete_consumption(id)
+
+    @http.route('/telecomservice/api/v2/consumption/export', type='http', auth='telecom_token', methods=['GET'])
+    def export_consumptions(self, **kwargs):
+        try:
+            export_format, fields_list, domain = request.env['telecom.api.service']._validate_export_params(kwargs)
+        except UserError as e:
+            return request.make_json_response({'error': str(e)}, status=400)
+
+        _logger.info(EXPORT_MSG, request.env.user.login, export_format)
+        registry, uid, context = request.env.registry, request.env.uid, dict(request.env.context)
+
+        def generate():
+            # The request cursor is closed once the response starts streaming, use a dedicated one
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                yield from env['telecom.api.service'].export_consumptions(export_format, fields_list, domain)
+
+        headers = [
+            ('Content-Type', EXPORT_CONTENT_TYPES[export_format]),
+            ('Content-Disposition', 'attachment; filename="consumptions.%s"' % export_format),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        # Chunks are compressed as they are streamed
+        encoding = compression.negotiate(request.httprequest.headers.get('Accept-Encoding'))
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+            return request.make_response(compression.compress_stream(generate(), encoding), headers=headers)
+        return request.make_response(generate(), headers=headers)
+
+    @http.route('/telecomservice/api/v2/metrics', type='http', auth='none', methods=['GET'])
+    def get_metrics(self, **kwargs):
+        if not metrics.is_authorized(request.env, request.httprequest.headers.get('Authorization')):
+            return request.not_found()
+        # Metrics are kept per worker process
+        return request.make_response(metrics.render(), headers=[('Content-Type', 'text/plain; version=0.0.4')])
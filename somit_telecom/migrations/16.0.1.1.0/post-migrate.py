@@ -0,0 +1,9 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    # Fill the daily totals and the usage counters with the consumptions created before they existed,
+    # the usage counters are computed from the daily totals
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['telecom.service.consumption.daily'].rebuild()
+    env['product.template']._recompute_usage_counters()
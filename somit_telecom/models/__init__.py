@@ -1,2 +1,10 @@
+from . import ir_http
 from . import product_category
-from . import telecom_sc
\ No newline at end of file
+from . import product_template
+from . import res_users
+from . import telecom_api_token
+from . import telecom_sc
+from . import telecom_sc_daily
+from . import telecom_sc_staging
+from . import telecom_sc_retention
+from . import telecom_sc_usage
\ No newline at end of file
@@ -0,0 +1,65 @@
+import json
+
+from werkzeug.exceptions import BadRequest
+
+from odoo import models
+from odoo.http import request
+
+from ..commons import compression
+
+
+class IrHttp(models.AbstractModel):
+    _inherit = 'ir.http'
+
+    @classmethod
+    def _auth_method_telecom_token(cls):
+        """
+            Authenticate with a bearer token (see telecom.api.token), or with the session like auth='user'
+        """
+        authorization = request.httprequest.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer '):
+            return cls._auth_method_user()
+
+        uid = request.env['telecom.api.token'].sudo().verify_token(authorization[len('Bearer '):].strip())
+        request.update_env(user=uid)
+
+    @classmethod
+    def _pre_dispatch(cls, rule, args):
+        super()._pre_dispatch(rule, args)
+        # Compressed JSON-RPC bodies (Content-Encoding: gzip or zstd) are decompressed before the dispatcher reads them
+        httprequest = request.httprequest
+        content_encoding = httprequest.headers.get('Content-Encoding')
+        if content_encoding and compression.is_api_request(httprequest):
+            try:
+                data = compression.decompress(httprequest.get_data(), content_encoding)
+            except ValueError as e:
+                raise BadRequest(str(e))
+            request.get_json_data = lambda: json.loads(data)
+
+    @classmethod
+    def _post_dispatch(cls, response):
+        super()._post_dispatch(response)
+        # JSON-RPC routes can not set the status code, see TelecomServiceAPIV2._conditional_response
+        if getattr(request, 'telecom_not_modified', False):
+            response.status_code = 304
+            response.set_data(b'')
+            # The copy of the client may be compressed, the tag it sent identifies it
+            tag = compression.match_etag(response.headers.get('ETag', ''), request.httprequest.headers.get('If-None-Match'))
+            if tag:
+                response.headers['ETag'] = tag
+            return
+
+        # Compress the API responses for the clients that accept it, streamed exports compress themselves
+        httprequest = request.httprequest
+        if not compression.is_api_request(httprequest) or response.is_streamed or response.status_code != 200:
+            return
+        response.vary.add('Accept-Encoding')
+        encoding = compression.negotiate(httprequest.headers.get('Accept-Encoding'))
+        if not encoding or 'Content-Encoding' in response.headers:
+            return
+        data = response.get_data()
+        if len(data) >= compression.COMPRESSION_MIN_SIZE:
+            response.set_data(compression.compress(data, encoding))
+            response.headers['Content-Encoding'] = encoding
+            if response.headers.get('ETag'):
+                response.headers['ETag'] = compression.encode_etag(response.headers['ETag'], encoding)
@@ -4,4 +4,26 @@ from odoo import models, fields, api, _
 class ProductCategory(models.Model):
     _inherit = "product.category"
 
-    code = fields.Char('Code', index=True)
\ No newline at end of file
+    code = fields.Char('Code', index=True)
+
+    def _is_telecom_category(self):
+        """
+            Check if any of the categories is a Telecom Service category or their parent
+        """
+        telecom_category_id = self.env['product.template']._get_telecom_category_id()
+        return any(telecom_category_id in (category.id, category.parent_id.id) for category in self)
+
+    def write(self, vals):
+        # Telecom Service lookups cached by product.template depend on the category tree
+        update_cache = 'parent_id' in vals and self._is_telecom_category()
+        res = super(ProductCategory, self).write(vals)
+        if update_cache or ('parent_id' in vals and self._is_telecom_category()):
+            self.clear_caches()
+        return res
+
+    def unlink(self):
+        update_cache = self._is_telecom_category()
+        res = super(ProductCategory, self).unlink()
+        if update_cache:
+            self.clear_caches()
+        return res
@@ -0,0 +1,121 @@
+from odoo import models, fields, api, tools
+
+from .telecom_sc_usage import COUNTER_FIELDS
+
+
+# Fields that change the result of the cached telecom service lookups
+TELECOM_SERVICE_CACHE_FIELDS = ['name', 'categ_id', 'active', 'company_id']
+
+
+class ProductTemplate(models.Model):
+    _inherit = "product.template"
+
+    # Usage counters, kept up to date by telecom.service.usage.delta
+    telecom_consumption_qty = fields.Integer('Total Consumption', readonly=True, copy=False)
+    telecom_period_consumption_qty = fields.Integer('Current Month Consumption', readonly=True, copy=False)
+    telecom_consumption_period = fields.Date('Consumption Period', readonly=True, copy=False)
+    telecom_last_consumption = fields.Datetime('Last Consumption', readonly=True, copy=False)
+
+    @api.model
+    @tools.ormcache()
+    def _get_telecom_category_id(self):
+        """
+            Get the parent category of every Telecom Service category
+        """
+        return self.env.ref('somit_telecom.product_category_telecom').id
+
+    @api.model
+    @tools.ormcache('self.env.uid', 'tuple(self.env.companies.ids)', 'product_tmpl_id')
+    def _get_telecom_service_id(self, product_tmpl_id):
+        """
+            Get the Telecom Service Template ID if it exists, False otherwise
+        """
+        return self.search([
+            ('id', '=', product_tmpl_id),
+            ('categ_id.parent_id', '=', self._get_telecom_category_id())
+        ]).id
+
+    @api.model
+    @tools.ormcache('self.env.uid', 'tuple(self.env.companies.ids)', 'name')
+    def _get_template_id_by_name(self, name):
+        """
+            Get the first Telecom Service Template ID with the given name, False otherwise
+        """
+        return self.search([
+            ('name', '=', name),
+            ('categ_id.parent_id', '=', self._get_telecom_category_id())
+        ], limit=1).id
+
+    def _is_telecom_service(self):
+        """
+            Check if any of the templates is a Telecom Service Template
+        """
+        telecom_category_id = self._get_telecom_category_id()
+        return any(template.categ_id.parent_id.id == telecom_category_id for template in self)
+
+    def _recompute_usage_counters(self):
+        """
+            Recompute the usage counters of the given templates, every Telecom Service Template by default
+            Totals come from the daily totals (they keep the history of removed consumptions),
+            rebuild them first if they are wrong.
+        """
+        templates = self or self.with_context(active_test=False).search([
+            ('categ_id.parent_id', '=', self._get_telecom_category_id())
+        ])
+        if not templates:
+            return True
+
+        # Pending deltas are flushed first, they would be counted twice otherwise
+        UsageDelta = self.env['telecom.service.usage.delta']
+        UsageDelta._flush_deltas()
+        self.env['telecom.service.consumption'].flush_model()
+        self.env['telecom.service.consumption.daily'].flush_model()
+        self.flush_model(COUNTER_FIELDS)
+        params = {'ids': tuple(templates.ids), 'period': UsageDelta._get_current_period()}
+        self.env.cr.execute("""
+            UPDATE product_template template SET
+                telecom_consumption_qty = COALESCE(totals.qty, 0),
+                telecom_period_consumption_qty = COALESCE(totals.period_qty, 0),
+                telecom_consumption_period = %(period)s,
+                telecom_last_consumption = (
+                    SELECT MAX(consumption_timestamp) FROM telecom_service_consumption WHERE product_tmpl_id = template.id
+                )
+            FROM product_template selected
+            LEFT JOIN (
+                SELECT
+                    product_tmpl_id,
+                    SUM(consumption_qty) AS qty,
+                    SUM(consumption_qty) FILTER (WHERE consumption_date >= %(period)s) AS period_qty
+                FROM telecom_service_consumption_daily
+                WHERE product_tmpl_id IN %(ids)s
+                GROUP BY product_tmpl_id
+            ) totals ON totals.product_tmpl_id = selected.id
+            WHERE template.id = selected.id AND selected.id IN %(ids)s
+        """, params)
+        self.invalidate_model(COUNTER_FIELDS)
+        return True
+
+    # The lookups are only cleared when a Telecom Service Template changes, clearing the ormcache
+    # empties it for the whole registry, in every worker
+    @api.model_create_multi
+    def create(self, vals_list):
+        templates = super(ProductTemplate, self).create(vals_list)
+        if templates._is_telecom_service():
+            self.clear_caches()
+        return templates
+
+    def write(self, vals):
+        # Templates moving in or out of Telecom are checked before and after the write
+        cache_fields = any(field in vals for field in TELECOM_SERVICE_CACHE_FIELDS)
+        update_cache = cache_fields and self._is_telecom_service()
+        res = super(ProductTemplate, self).write(vals)
+        if update_cache or (cache_fields and self._is_telecom_service()):
+            self.clear_caches()
+        return res
+
+    def unlink(self):
+        update_cache = self._is_telecom_service()
+        res = super(ProductTemplate, self).unlink()
+        if update_cache:
+            self.clear_caches()
+        return res
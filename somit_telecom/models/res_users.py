@@ -0,0 +1,19 @@
+from odoo import models, api
+
+
+class ResUsers(models.Model):
+    _inherit = 'res.users'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        users = super(ResUsers, self).create(vals_list)
+        # Ids without a user are cached as not allowed to use API tokens
+        self.env['telecom.api.token'].clear_caches()
+        return users
+
+    def write(self, vals):
+        res = super(ResUsers, self).write(vals)
+        # The verification of the API tokens is cached with the session token of their user (see telecom.api.token)
+        if set(vals) & set(self._get_session_token_fields()):
+            self.env['telecom.api.token'].clear_caches()
+        return res
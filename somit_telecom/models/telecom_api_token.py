@@ -0,0 +1,26 @@
+from odoo import models, fields, api
+
+
+class TelecomAPITokenRevocation(models.Model):
+    """
+        Bearer tokens revoked before their expiration (see telecom.api.token)
+        Only the token id is kept, the entries are removed by the autovacuum once the token has expired.
+    """
+    _name = 'telecom.api.token.revocation'
+    _description = 'Telecom Service API Token Revocation'
+    _log_access = False
+
+    token_id = fields.Char('Token ID', required=True, readonly=True, index=True)
+    expires_at = fields.Datetime('Expires At', required=True, readonly=True)
+
+    _sql_constraints = [
+        (
+            'token_id_uniq',
+            'unique(token_id)',
+            'A token can only be revoked once.'
+        ),
+    ]
+
+    @api.autovacuum
+    def _gc_expired(self):
+        self.search([('expires_at', '<', fields.Datetime.now())]).unlink()
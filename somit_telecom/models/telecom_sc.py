@@ -1,5 +1,7 @@
 from ..commons.utils import parse_dates
+from .telecom_sc_daily import ROLLUP_FIELDS
 from odoo import models, fields, api, _
+from odoo.tools import sql
 
 
 class TelecomServiceConsumption(models.Model):
@@ -10,11 +12,12 @@ class TelecomServiceConsumption(models.Model):
     def _get_domain_product_tmpl_id(self):
         return [
             '&',
-                ('categ_id.parent_id', '=', self.env.ref('somit_telecom.product_category_telecom').id),
+                ('categ_id.parent_id', '=', self.env['product.template']._get_telecom_category_id()),
                 '|', ('company_id', '=', False), ('company_id', '=', self.env.company.id)
         ]
     
-    name = fields.Char('Name', compute='_compute_name', store=True, default=_('New'), index=True, readonly=True)
+    # Stored computed fields are precomputed: create inserts them instead of computing them after the insert
+    name = fields.Char('Name', compute='_compute_name', store=True, precompute=True, index=True, readonly=True)
     company_id = fields.Many2one('res.company', 'Company', default=lambda self: self.env.company, index=True, required=True)
     
     # Telecom Service Product
@@ -30,33 +33,64 @@ class TelecomServiceConsumption(models.Model):
     telecom_service_name = fields.Char('Telecom Service Name', related='product_tmpl_id.name', readonly=True)
     
     # Telecom Service Category
-    category_id = fields.Many2one('product.category', 'Product Category', related='product_tmpl_id.categ_id', store=True, readonly=True, index=True)
+    category_id = fields.Many2one('product.category', 'Product Category', related='product_tmpl_id.categ_id', store=True, precompute=True, readonly=True, index=True)
     category_name = fields.Char('Category Name', related='category_id.name', readonly=True)
-    category_code = fields.Char('Category Code', related='category_id.code', store=True, readonly=True, index=True)
+    category_code = fields.Char('Category Code', related='category_id.code', store=True, precompute=True, readonly=True, index=True)
 
     # Telecom Service Consumption
     consumption_timestamp = fields.Datetime('Consumption Timestamp', required=True, default=fields.Datetime.now, index=True)
     consumption_reference = fields.Char('Telecom Service Consumption Reference', related='product_tmpl_id.default_code', readonly=True)
     consumption_qty = fields.Integer('Consumption Quantity', required=True, default=1)
 
+    # Idempotency key sent by the client, retried creations with the same key return the existing consumption
+    client_reference = fields.Char('Client Reference', readonly=True, copy=False)
+
+    _sql_constraints = [
+        (
+            'client_reference_uniq',
+            'unique(company_id, client_reference)',
+            'The client reference must be unique per company.'
+        ),
+    ]
+
+    def init(self):
+        # Composite index backing the keyset pagination of the API (see CURSOR_ORDER)
+        sql.create_index(
+            self._cr,
+            'telecom_service_consumption_timestamp_id_index',
+            self._table,
+            ['consumption_timestamp DESC', 'id DESC']
+        )
+        # Composite indexes backing the list filters of the API (see LIST_FILTERS)
+        for field in ['product_tmpl_id', 'category_code', 'company_id']:
+            sql.create_index(
+                self._cr,
+                'telecom_service_consumption_%s_timestamp_index' % field,
+                self._table,
+                [field, 'consumption_timestamp DESC', 'id DESC']
+            )
+
     @api.depends('telecom_service_name', 'consumption_timestamp')
     def _compute_name(self):
+        # Read the names of every template at once, create precomputes the names of a whole batch
+        self.product_tmpl_id.mapped('name')
         for record in self:
             record.name = '%s - %s' % (record.telecom_service_name, record.consumption_timestamp)
     
     @api.constrains('product_tmpl_id')
     def _check_product_tmpl_id(self):
-        for record in self:
-            if not record.product_tmpl_id:
-                raise ValueError(_('Telecom Service Template is required'))
-            if not record.product_tmpl_id.categ_id.parent_id.id == self.env.ref('somit_telecom.product_category_telecom').id:
-                raise ValueError(_('Telecom Service Template must be a Telecom Service'))
+        if any(not record.product_tmpl_id for record in self):
+            raise ValueError(_('Telecom Service Template is required'))
+
+        # Check each distinct template once, their categories are prefetched together
+        telecom_category_id = self.env['product.template']._get_telecom_category_id()
+        if any(template.categ_id.parent_id.id != telecom_category_id for template in self.product_tmpl_id):
+            raise ValueError(_('Telecom Service Template must be a Telecom Service'))
             
     @api.constrains('consumption_qty')
     def _check_consumption_qty(self):
-        for record in self:
-            if record.consumption_qty <= 0:
-                raise ValueError(_('Consumption Quantity must be greater than 0'))
+        if any(record.consumption_qty <= 0 for record in self):
+            raise ValueError(_('Consumption Quantity must be greater than 0'))
             
     @api.onchange('consumption_qty')
     def _onchange_consumption_qty(self):
@@ -67,14 +101,26 @@ class TelecomServiceConsumption(models.Model):
     def create(self, vals_list):
         for vals in vals_list:
             if vals.get('consumption_timestamp', False):
-                vals['consumption_timestamp'] = parse_dates(vals['consumption_timestamp'])
-            if vals.get('product_tmpl_id', False) and vals.get('consumption_timestamp', False):
-                vals['name'] = '%s - %s' % (self.env['product.template'].browse(vals['product_tmpl_id']).name, vals['consumption_timestamp'])
-        
-        return super(TelecomServiceConsumption, self).create(vals_list)
+                vals['consumption_timestamp'] = parse_dates(vals['consumption_timestamp'], self.env.uid)
+
+        records = super(TelecomServiceConsumption, self).create(vals_list)
+        self.env['telecom.service.usage.delta']._add_consumptions(records)
+        return records
     
     def write(self, vals):
         if vals.get('consumption_timestamp', False):
-            vals['consumption_timestamp'] = parse_dates(vals['consumption_timestamp'])
-        
-        return super(TelecomServiceConsumption, self).write(vals)
\ No newline at end of file
+            vals['consumption_timestamp'] = parse_dates(vals['consumption_timestamp'], self.env.uid)
+
+        # Move the consumptions out of their daily totals and usage counters and back in with the new values
+        UsageDelta = self.env['telecom.service.usage.delta']
+        update_rollup = any(field in vals for field in ROLLUP_FIELDS)
+        if update_rollup:
+            UsageDelta._add_consumptions(self, sign=-1)
+        res = super(TelecomServiceConsumption, self).write(vals)
+        if update_rollup:
+            UsageDelta._add_consumptions(self)
+        return res
+
+    def unlink(self):
+        self.env['telecom.service.usage.delta']._add_consumptions(self, sign=-1)
+        return super(TelecomServiceConsumption, self).unlink()
\ No newline at end of file
@@ -0,0 +1,108 @@
+import logging
+
+from odoo import models, fields, api
+
+
+_logger = logging.getLogger(__name__)
+
+
+# Fields of telecom.service.consumption that change the daily totals
+ROLLUP_FIELDS = ['consumption_timestamp', 'product_tmpl_id', 'company_id', 'consumption_qty']
+
+# Daily Totals Log Messages
+REBUILD_RETAINED_MSG = 'Daily totals are only rebuilt from %s, the older consumptions were removed by the retention'
+
+
+class TelecomServiceConsumptionDaily(models.Model):
+    _name = 'telecom.service.consumption.daily'
+    _description = 'Telecom Service Daily Consumption'
+    _order = 'consumption_date desc'
+
+    consumption_date = fields.Date('Consumption Date', required=True, readonly=True, index=True)
+    company_id = fields.Many2one('res.company', 'Company', required=True, readonly=True, index=True, ondelete='cascade')
+    product_tmpl_id = fields.Many2one('product.template', 'Telecom Service Template', required=True, readonly=True, index=True, ondelete='cascade')
+    category_id = fields.Many2one('product.category', 'Product Category', related='product_tmpl_id.categ_id', store=True, readonly=True, index=True)
+    category_code = fields.Char('Category Code', related='category_id.code', store=True, readonly=True, index=True)
+    consumption_qty = fields.Integer('Consumption Quantity', readonly=True)
+    consumption_count = fields.Integer('Consumption Count', readonly=True)
+
+    _sql_constraints = [
+        (
+            'consumption_daily_uniq',
+            'unique(consumption_date, product_tmpl_id, company_id)',
+            'There can only be one daily total per day, telecom service and company.'
+        ),
+    ]
+
+    @api.model
+    def _apply_deltas(self):
+        """
+            Add the deltas being flushed (see telecom.service.usage.delta) to the daily totals
+            The totals are updated with a single upsert, in key order so that two flushes never deadlock.
+            Days are UTC days.
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            INSERT INTO telecom_service_consumption_daily (
+                consumption_date, product_tmpl_id, company_id, category_id, category_code,
+                consumption_qty, consumption_count, create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                delta.consumption_timestamp::date, delta.product_tmpl_id, delta.company_id, MIN(template.categ_id), MIN(category.code),
+                SUM(delta.consumption_qty), SUM(CASE WHEN delta.consumption_qty > 0 THEN 1 ELSE -1 END),
+                %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+            FROM telecom_service_usage_flush delta
+            JOIN product_template template ON template.id = delta.product_tmpl_id
+            LEFT JOIN product_category category ON category.id = template.categ_id
+            GROUP BY delta.consumption_timestamp::date, delta.product_tmpl_id, delta.company_id
+            ORDER BY delta.consumption_timestamp::date, delta.product_tmpl_id, delta.company_id
+            ON CONFLICT (consumption_date, product_tmpl_id, company_id) DO UPDATE SET
+                consumption_qty = telecom_service_consumption_daily.consumption_qty + EXCLUDED.consumption_qty,
+                consumption_count = telecom_service_consumption_daily.consumption_count + EXCLUDED.consumption_count,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+            RETURNING id, consumption_count
+        """, {'uid': self.env.uid})
+
+        # Days without consumptions left are removed
+        empty_ids = tuple(daily_id for daily_id, count in self.env.cr.fetchall() if count <= 0)
+        if empty_ids:
+            self.env.cr.execute('DELETE FROM telecom_service_consumption_daily WHERE id IN %s', (empty_ids,))
+        self.invalidate_model()
+
+    @api.model
+    def rebuild(self, date_from=False):
+        """
+            Recompute the daily totals from the consumptions, from date_from or from scratch
+            Pending deltas are flushed first, they would be counted twice otherwise.
+            The days emptied by the retention are never rebuilt, the daily totals keep their history.
+        """
+        retained_from = self.env['telecom.service.consumption']._get_retained_from()
+        date_from = fields.Date.to_date(date_from)
+        if retained_from and (not date_from or date_from < retained_from):
+            _logger.info(REBUILD_RETAINED_MSG, retained_from)
+            date_from = retained_from
+
+        self.env['telecom.service.usage.delta']._flush_deltas()
+        self.env['telecom.service.consumption'].flush_model()
+        self.flush_model()
+        params = {'uid': self.env.uid, 'date_from': date_from or None}
+        if date_from:
+            self.env.cr.execute('DELETE FROM telecom_service_consumption_daily WHERE consumption_date >= %(date_from)s::date', params)
+        else:
+            self.env.cr.execute('DELETE FROM telecom_service_consumption_daily')
+        self.env.cr.execute("""
+            INSERT INTO telecom_service_consumption_daily (
+                consumption_date, product_tmpl_id, company_id, category_id, category_code,
+                consumption_qty, consumption_count, create_uid, create_date, write_uid, write_date
+            )
+            SELECT
+                consumption_timestamp::date, product_tmpl_id, company_id, MIN(category_id), MIN(category_code),
+                SUM(consumption_qty), COUNT(*),
+                %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+            FROM telecom_service_consumption
+            WHERE %(date_from)s IS NULL OR consumption_timestamp >= %(date_from)s::date
+            GROUP BY consumption_timestamp::date, product_tmpl_id, company_id
+        """, params)
+        self.invalidate_model()
+        return True
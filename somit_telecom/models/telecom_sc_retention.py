@@ -0,0 +1,120 @@
+import logging
+import threading
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api
+
+
+_logger = logging.getLogger(__name__)
+
+
+# Retention Settings (ir.config_parameter)
+RETENTION_MONTHS_PARAM = 'somit_telecom.consumption_retention_months'
+RETENTION_MODE_PARAM = 'somit_telecom.consumption_retention_mode'
+# Set by the retention: first day still fully covered by the consumptions, the daily totals keep the older ones
+RETAINED_FROM_PARAM = 'somit_telecom.consumption_retained_from'
+RETENTION_MODES = ['delete', 'archive']
+
+# Retention Constants
+RETENTION_CHUNK_SIZE = 50000
+ARCHIVE_TABLE = 'telecom_service_consumption_archive'
+ARCHIVE_COLUMNS = [
+    'id', 'name', 'company_id', 'product_tmpl_id', 'category_id', 'category_code',
+    'consumption_timestamp', 'consumption_qty', 'client_reference', 'create_uid', 'create_date', 'write_uid', 'write_date',
+]
+
+# Retention Log Messages
+RETENTION_MSG = 'Removed %s consumptions of %s (%s)'
+INVALID_RETENTION_MODE_MSG = 'Invalid consumption retention mode %s, consumptions will not be removed'
+
+
+class TelecomServiceConsumption(models.Model):
+    _inherit = 'telecom.service.consumption'
+
+    def _get_retention_cutoff(self):
+        """
+            Get the first day of the oldest month to keep, False if the retention is disabled
+        """
+        months = int(self.env['ir.config_parameter'].sudo().get_param(RETENTION_MONTHS_PARAM, 0) or 0)
+        if months <= 0:
+            return False
+        return fields.Datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0) - relativedelta(months=months)
+
+    @api.model
+    def _get_retained_from(self):
+        """
+            Get the first day still fully covered by the consumptions, False if the retention never removed any
+        """
+        return fields.Date.to_date(self.env['ir.config_parameter'].sudo().get_param(RETAINED_FROM_PARAM, False))
+
+    def _remove_month(self, month_start, month_end, mode, auto_commit):
+        """
+            Remove (or archive, then remove) the consumptions of a month, in chunks of RETENTION_CHUNK_SIZE
+            Consumptions are removed with SQL instead of unlink: the daily totals keep their history.
+        """
+        archive = 'INSERT INTO %s (%s) SELECT %s FROM removed' % (ARCHIVE_TABLE, ', '.join(ARCHIVE_COLUMNS), ', '.join(ARCHIVE_COLUMNS))
+        removed = 0
+        while True:
+            self.env.cr.execute("""
+                WITH removed AS (
+                    DELETE FROM telecom_service_consumption
+                    WHERE id IN (
+                        SELECT id FROM telecom_service_consumption
+                        WHERE consumption_timestamp >= %%s AND consumption_timestamp < %%s
+                        LIMIT %%s
+                    )
+                    RETURNING *
+                )
+                %s
+            """ % (archive if mode == 'archive' else 'SELECT COUNT(*) FROM removed'), (month_start, month_end, RETENTION_CHUNK_SIZE))
+            count = self.env.cr.rowcount
+            if mode == 'delete':
+                count = self.env.cr.fetchone()[0]
+            removed += count
+            if auto_commit:
+                self.env.cr.commit()
+            if count < RETENTION_CHUNK_SIZE:
+                return removed
+
+    @api.model
+    def _apply_retention(self):
+        """
+            Remove the consumptions older than the configured number of months, a whole month at a time
+            Called by the cron, the mode (delete or archive) is set with the system parameters.
+        """
+        cutoff = self._get_retention_cutoff()
+        if not cutoff:
+            return True
+
+        mode = self.env['ir.config_parameter'].sudo().get_param(RETENTION_MODE_PARAM, 'delete')
+        if mode not in RETENTION_MODES:
+            _logger.warning(INVALID_RETENTION_MODE_MSG, mode)
+            return True
+
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        self.flush_model()
+        if mode == 'archive':
+            self.env.cr.execute('CREATE TABLE IF NOT EXISTS %s AS SELECT %s FROM %s WITH NO DATA' % (
+                ARCHIVE_TABLE, ', '.join(ARCHIVE_COLUMNS), self._table
+            ))
+
+        self.env.cr.execute('SELECT MIN(consumption_timestamp) FROM telecom_service_consumption')
+        oldest = self.env.cr.fetchone()[0]
+        if not oldest:
+            return True
+
+        month_start = oldest.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        while month_start < cutoff:
+            month_end = month_start + relativedelta(months=1)
+            # Committed with the first chunk, rebuilding the daily totals of the month would lose its history
+            retained_from = self._get_retained_from()
+            if not retained_from or retained_from < month_end.date():
+                self.env['ir.config_parameter'].sudo().set_param(RETAINED_FROM_PARAM, fields.Date.to_string(month_end))
+            removed = self._remove_month(month_start, month_end, mode, auto_commit)
+            if removed:
+                _logger.info(RETENTION_MSG, removed, month_start.strftime('%Y-%m'), mode)
+            month_start = month_end
+
+        self.invalidate_model()
+        return True
@@ -0,0 +1,127 @@
+import logging
+import threading
+from datetime import timedelta
+
+from psycopg2 import OperationalError
+
+from odoo import models, fields, api
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
+
+
+_logger = logging.getLogger(__name__)
+
+
+# Staging Constants
+STAGING_BATCH_SIZE = 1000
+STAGING_MAX_BATCHES = 50
+STAGING_RETENTION_DAYS = 7
+
+# Staging Log Messages
+STAGING_PROCESSED_MSG = 'Processed %s staged consumptions'
+STAGING_FAILED_MSG = 'Failed to process staged consumptions of user %s'
+
+
+class TelecomServiceConsumptionStaging(models.Model):
+    _name = 'telecom.service.consumption.staging'
+    _description = 'Telecom Service Consumption Staging'
+    _order = 'id'
+
+    ticket = fields.Char('Ticket', required=True, readonly=True, index=True)
+    sequence = fields.Integer('Sequence', readonly=True)
+    user_id = fields.Many2one('res.users', 'User', required=True, readonly=True, ondelete='cascade')
+    payload = fields.Json('Payload', readonly=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('error', 'Error'),
+    ], 'State', required=True, default='pending', readonly=True, index=True)
+    consumption_id = fields.Many2one('telecom.service.consumption', 'Consumption', readonly=True, ondelete='set null')
+    error = fields.Char('Error', readonly=True)
+
+    def _lock_pending(self, limit):
+        """
+            Lock a batch of pending consumptions, the ones locked by other workers are skipped
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT id FROM telecom_service_consumption_staging
+            WHERE state = 'pending'
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (limit,))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _save_results(self, results):
+        """
+            Store the (staging id, state, consumption id, error) results with a single update
+        """
+        if not results:
+            return
+
+        values = ', '.join(['(%s, %s, %s::integer, %s)'] * len(results))
+        params = [value for result in results for value in result]
+        self.env.cr.execute("""
+            UPDATE telecom_service_consumption_staging AS staging
+            SET state = result.state, consumption_id = result.consumption_id, error = result.error,
+                write_uid = %%s, write_date = NOW() AT TIME ZONE 'UTC'
+            FROM (VALUES %s) AS result (id, state, consumption_id, error)
+            WHERE staging.id = result.id
+        """ % values, [self.env.uid] + params)
+        self.invalidate_model(['state', 'consumption_id', 'error'])
+
+    def _process_batch(self, stagings):
+        """
+            Create the consumptions of a batch of staged payloads, as the users that sent them
+        """
+        ApiService = self.env['telecom.api.service']
+
+        results = []
+        for user in stagings.user_id:
+            user_stagings = stagings.filtered(lambda staging: staging.user_id == user)
+            try:
+                with self.env.cr.savepoint():
+                    created = ApiService.with_user(user).create_consumption_batch(user_stagings.mapped('payload'))
+            except Exception as e:
+                if isinstance(e, OperationalError) and e.pgcode in PG_CONCURRENCY_ERRORS_TO_RETRY:
+                    # The batch stays pending, the next run processes it with a new transaction
+                    raise
+                _logger.exception(STAGING_FAILED_MSG, user.login)
+                results += [(staging.id, 'error', None, str(e)) for staging in user_stagings]
+                continue
+
+            for staging, result in zip(user_stagings, created):
+                if result['success']:
+                    results.append((staging.id, 'done', result['id'], None))
+                else:
+                    results.append((staging.id, 'error', None, result['error']))
+
+        self._save_results(results)
+
+    @api.model
+    def _process_staging(self, batch_size=STAGING_BATCH_SIZE, max_batches=STAGING_MAX_BATCHES):
+        """
+            Drain the staged consumptions into telecom.service.consumption in large batches
+            Called by the cron, several workers can run it at the same time.
+        """
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+
+        processed = 0
+        for _batch in range(max_batches):
+            stagings = self._lock_pending(batch_size)
+            if not stagings:
+                break
+            self._process_batch(stagings)
+            processed += len(stagings)
+            if auto_commit:
+                self.env.cr.commit()
+
+        if processed:
+            _logger.info(STAGING_PROCESSED_MSG, processed)
+
+        # Processed tickets are only kept for a while
+        self.search([
+            ('state', '!=', 'pending'),
+            ('write_date', '<', fields.Datetime.now() - timedelta(days=STAGING_RETENTION_DAYS)),
+        ]).unlink()
+        return True
@@ -0,0 +1,150 @@
+import logging
+
+from odoo import models, fields, api
+
+
+_logger = logging.getLogger(__name__)
+
+
+# Usage Counters Constants
+# Stored usage counters of product.template
+COUNTER_FIELDS = [
+    'telecom_consumption_qty', 'telecom_period_consumption_qty', 'telecom_consumption_period', 'telecom_last_consumption'
+]
+USAGE_FLUSH_BATCH_SIZE = 100000
+USAGE_FLUSH_MAX_BATCHES = 50
+
+# Usage Counters Log Messages
+USAGE_FLUSHED_MSG = 'Flushed %s usage deltas'
+
+
+class TelecomServiceUsageDelta(models.Model):
+    """
+        Pending changes of the daily totals and of the usage counters of the Telecom Service Templates
+        Consumptions only insert deltas, the cron adds them to the totals in batches so that concurrent
+        consumptions of the same template, day and company never update (and wait on) the same rows.
+    """
+    _name = 'telecom.service.usage.delta'
+    _description = 'Telecom Service Usage Delta'
+    _order = 'id'
+    _log_access = False
+
+    product_tmpl_id = fields.Many2one('product.template', 'Telecom Service Template', required=True, readonly=True, ondelete='cascade')
+    company_id = fields.Many2one('res.company', 'Company', required=True, readonly=True, ondelete='cascade')
+    consumption_timestamp = fields.Datetime('Consumption Timestamp', required=True, readonly=True)
+    consumption_qty = fields.Integer('Consumption Quantity', readonly=True)
+
+    @api.model
+    def _get_current_period(self):
+        """
+            Get the first day of the current period (month) of the usage counters
+        """
+        return fields.Date.today().replace(day=1)
+
+    @api.model
+    def _add_consumptions(self, consumptions, sign=1):
+        """
+            Queue the given consumptions to be added (sign=1) or subtracted (sign=-1) from the totals
+        """
+        if not consumptions:
+            return
+
+        consumptions.flush_recordset(['product_tmpl_id', 'company_id', 'consumption_timestamp', 'consumption_qty'])
+        self.env.cr.execute("""
+            INSERT INTO telecom_service_usage_delta (product_tmpl_id, company_id, consumption_timestamp, consumption_qty)
+            SELECT product_tmpl_id, company_id, consumption_timestamp, %s * consumption_qty
+            FROM telecom_service_consumption
+            WHERE id IN %s
+        """, (sign, tuple(consumptions.ids)))
+
+    @api.model
+    def _lock_batch(self, batch_size):
+        """
+            Move a batch of deltas to the telecom_service_usage_flush temporary table
+            The deltas locked by another flush are skipped. Returns the number of deltas moved.
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            CREATE TEMPORARY TABLE IF NOT EXISTS telecom_service_usage_flush (
+                product_tmpl_id integer, company_id integer, consumption_timestamp timestamp, consumption_qty integer
+            );
+            TRUNCATE telecom_service_usage_flush;
+            WITH deltas AS (
+                DELETE FROM telecom_service_usage_delta
+                WHERE id IN (
+                    SELECT id FROM telecom_service_usage_delta ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+                )
+                RETURNING product_tmpl_id, company_id, consumption_timestamp, consumption_qty
+            )
+            INSERT INTO telecom_service_usage_flush SELECT * FROM deltas
+        """, (batch_size,))
+        return self.env.cr.rowcount
+
+    @api.model
+    def _apply_usage_counters(self, period):
+        """
+            Add the deltas being flushed to the usage counters of the Telecom Service Templates
+        """
+        self.env.cr.execute("""
+            WITH totals AS (
+                SELECT
+                    product_tmpl_id,
+                    SUM(consumption_qty) AS qty,
+                    SUM(consumption_qty) FILTER (WHERE consumption_timestamp >= %(period)s) AS period_qty,
+                    MAX(consumption_timestamp) FILTER (WHERE consumption_qty > 0) AS last_consumption,
+                    BOOL_OR(consumption_qty < 0) AS removed
+                FROM telecom_service_usage_flush
+                GROUP BY product_tmpl_id
+            )
+            UPDATE product_template template SET
+                telecom_consumption_qty = COALESCE(template.telecom_consumption_qty, 0) + totals.qty,
+                telecom_period_consumption_qty = COALESCE(totals.period_qty, 0) + CASE
+                    WHEN template.telecom_consumption_period = %(period)s THEN COALESCE(template.telecom_period_consumption_qty, 0)
+                    ELSE 0
+                END,
+                telecom_consumption_period = %(period)s,
+                telecom_last_consumption = GREATEST(template.telecom_last_consumption, totals.last_consumption)
+            FROM totals
+            WHERE template.id = totals.product_tmpl_id
+            RETURNING template.id, totals.removed
+        """, {'period': period})
+
+        # The last consumption can only go back by reading it again, the index on the template makes it cheap
+        removed_ids = tuple(template_id for template_id, removed in self.env.cr.fetchall() if removed)
+        if removed_ids:
+            self.env.cr.execute("""
+                UPDATE product_template template SET telecom_last_consumption = (
+                    SELECT MAX(consumption_timestamp) FROM telecom_service_consumption WHERE product_tmpl_id = template.id
+                )
+                WHERE id IN %s
+            """, (removed_ids,))
+
+    @api.model
+    def _flush_deltas(self, batch_size=USAGE_FLUSH_BATCH_SIZE, max_batches=USAGE_FLUSH_MAX_BATCHES):
+        """
+            Add the pending deltas to the daily totals and to the usage counters
+            Called by the cron, the usage counters of a new period start from zero.
+        """
+        ConsumptionDaily = self.env['telecom.service.consumption.daily']
+        ProductTemplate = self.env['product.template']
+        ProductTemplate.flush_model(COUNTER_FIELDS)
+        period = self._get_current_period()
+
+        flushed = 0
+        for _batch in range(max_batches):
+            count = self._lock_batch(batch_size)
+            if not count:
+                break
+            ConsumptionDaily._apply_deltas()
+            self._apply_usage_counters(period)
+            flushed += count
+
+        self.env.cr.execute("""
+            UPDATE product_template SET telecom_period_consumption_qty = 0, telecom_consumption_period = %s
+            WHERE telecom_consumption_period < %s
+        """, (period, period))
+        ProductTemplate.invalidate_model(COUNTER_FIELDS)
+
+        if flushed:
+            _logger.info(USAGE_FLUSHED_MSG, flushed)
+        return True
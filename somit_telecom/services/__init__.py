@@ -1 +1,3 @@
-from . import api_service
\ No newline at end of file
+from . import api_service
+from . import import_service
+from . import token_service
\ No newline at end of file
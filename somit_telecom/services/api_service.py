@@ -1,11 +1,42 @@
-from odoo import models, api
+import base64
+import csv
+import hashlib
+import io
+import json
+import logging
+import random
+import time
+import uuid
+from datetime import datetime
+
+from psycopg2 import IntegrityError, OperationalError, errorcodes, errors
+
+from odoo import models, fields, api
 from odoo.exceptions import UserError, AccessDenied
+from odoo.service.model import PG_CONCURRENCY_ERRORS_TO_RETRY
 
+from ..commons import compression, metrics
 from ..commons.utils import parse_dates
 
 
+_logger = logging.getLogger(__name__)
+
+
+class ClientReferenceConflict(errors.SerializationFailure):
+    """
+        A concurrent transaction committed a client reference after the current one started
+        The serialization failure code makes Odoo retry the whole request with a new snapshot.
+    """
+    pgcode = errorcodes.SERIALIZATION_FAILURE
+
 # API Model
 WRITEABLE_FIELDS = ['product_tmpl_id', 'company_id', 'consumption_timestamp', 'consumption_qty'] 
+# The client reference (idempotency key) can only be set on creation
+CREATE_FIELDS = WRITEABLE_FIELDS + ['client_reference']
+CLIENT_REFERENCE_MAX_LENGTH = 128
+CLIENT_REFERENCE_CONSTRAINT = 'telecom_service_consumption_client_reference_uniq'
+# consumption_qty is stored as a PostgreSQL integer
+CONSUMPTION_QTY_MAX = 2 ** 31 - 1
 
 # API Messages
 ACCESS_DENIED_MSG = 'Authentication failed. Check your credentials or contact the system administrator.'
@@ -14,15 +45,112 @@ INVALID_TELECOM_SERVICE_MSG = 'Invalid Telecom Service Template ID or Name provi
 UNKNOWN_TELECOM_SERVICE_MSG = 'The Telecom Service Template ID or Name provided does not exist.'
 INVALID_DATE_FORMAT_MSG = 'Invalid date format.'
 INVALID_CONSUMPTION_QTY_MSG = 'Invalid consumption quantity provided. Check the quantity and try again.'
+INVALID_TELECOM_SERVICE_COMPANY_MSG = 'The Telecom Service Template provided does not belong to the company of the consumption.'
 MISSING_TELECOM_SERVICE_MSG = 'To create a consumption you must provide a Telecom Service Template ID or Name.'
 MISSING_COMPANY_MSG = 'Missing company ID. Using the current user\'s company instead.'
 MISSING_CONSUMPTION_QTY_MSG = 'To create a consumption you must provide a consumption quantity.'
 MISSING_DATE_MSG = 'To create a consumption you must provide a consumption timestamp.'
 MISSING_CONSUMPTION_MSG = 'Consumption not found. Check the ID provided and try again.'
+INVALID_FILTER_MSG = 'Invalid value provided for the %s filter.'
+INVALID_COUNT_MODE_MSG = 'Invalid count mode provided. Available count modes: %s.'
+INVALID_ROW_FORMAT_MSG = 'Invalid row format provided. Available row formats: %s.'
+MISSING_BULK_SELECTION_MSG = 'To update or delete consumptions in bulk you must provide a list of IDs or some filters.'
+INVALID_BULK_IDS_MSG = 'Invalid list of consumption IDs provided.'
+BULK_LIMIT_EXCEEDED_MSG = 'Too many consumptions selected. The maximum is %s, narrow the filters and try again.'
+MISSING_BULK_VALUES_MSG = 'To update consumptions in bulk you must provide the values to write.'
+MISSING_TICKET_MSG = 'Ticket not found. Check the ticket provided and try again.'
+CLIENT_REFERENCE_CONFLICT_MSG = 'A concurrent request created the same client reference, the request must be retried.'
+INVALID_CLIENT_REFERENCE_MSG = 'Invalid client reference provided. It must be a non empty text of up to %s characters.'
+INVALID_BATCH_MSG = 'To create consumptions in batch you must provide a list of consumptions.'
+BATCH_LIMIT_EXCEEDED_MSG = 'Too many consumptions provided. The maximum batch size is %s.'
+INVALID_BATCH_ITEM_MSG = 'Each consumption in the batch must be a dictionary.'
+INVALID_CURSOR_MSG = 'Invalid cursor provided. Use the next_cursor returned by the previous page.'
+INVALID_READ_FIELDS_MSG = 'Invalid fields provided: %s.'
+INVALID_GROUPBY_MSG = 'Invalid group by provided: %s. Available group by: %s.'
+INVALID_TIME_BUCKET_MSG = 'Invalid time bucket provided. Available time buckets: %s.'
+INVALID_EXPORT_FORMAT_MSG = 'Invalid export format provided. Available formats: %s.'
+INVALID_EXPORT_FIELDS_MSG = 'Invalid export fields provided: %s. Available fields: %s.'
+
+# API Constants
+SERVICE_CONSUMPTIONS_BATCH_LIMIT = 10000
+SERVICE_CONSUMPTIONS_BULK_LIMIT = 100000
+# Keyset pagination order, id breaks the ties between consumptions with the same timestamp
+CURSOR_PAGINATION = 'cursor'
+CURSOR_ORDER = 'consumption_timestamp desc, id desc'
+
+# Read Constants
+# Related non stored fields (telecom_service_name, category_name, consumption_reference) are only read on demand
+READ_DEFAULT_FIELDS = [
+    'id', 'name', 'company_id', 'product_tmpl_id', 'category_code', 'consumption_timestamp', 'consumption_qty'
+]
+
+# List Count Modes
+# 'auto' counts exactly unless the planner estimates more than COUNT_EXACT_THRESHOLD rows
+COUNT_MODES = ['exact', 'estimate', 'auto']
+COUNT_EXACT_THRESHOLD = 100000
+
+# List Row Formats
+# 'compact' sends one array per field and the name of each many2one id once, instead of one dict per record
+ROW_FORMATS = ['records', 'compact']
+ROW_FORMAT_COMPACT = 'compact'
+
+# List Filters
+# Filter parameter: (field, operator, value type), lists are accepted for the 'in' filters
+LIST_FILTERS = {
+    'product_tmpl_id': ('product_tmpl_id', 'in', int),
+    'category_code': ('category_code', 'in', str),
+    'company_id': ('company_id', 'in', int),
+    'qty_min': ('consumption_qty', '>=', int),
+    'qty_max': ('consumption_qty', '<=', int),
+}
+
+# Aggregation Constants
+AGGREGATE_GROUPBY = ['product_tmpl_id', 'category_code', 'company_id']
+AGGREGATE_TIME_BUCKETS = ['hour', 'day', 'week', 'month', 'quarter', 'year']
+AGGREGATE_DAILY_TIME_BUCKETS = ['day', 'week', 'month', 'quarter', 'year']
+AGGREGATE_SOURCE_DAILY = 'daily'
+
+# Export Constants
+# Only stored columns can be exported, many2one fields are exported as ids
+EXPORT_FIELDS = [
+    'id', 'name', 'company_id', 'product_tmpl_id', 'category_id', 'category_code', 'consumption_timestamp', 'consumption_qty',
+    'client_reference'
+]
+EXPORT_DEFAULT_FIELDS = ['id', 'product_tmpl_id', 'company_id', 'category_code', 'consumption_timestamp', 'consumption_qty']
+EXPORT_FORMATS = ['ndjson', 'csv']
+EXPORT_CHUNK_SIZE = 2000
+
+# Concurrency Constants
+# Errors that only abort the statement, it can be retried from a savepoint. Serialization failures need
+# a new transaction (repeatable read), they are retried by Odoo with the whole request.
+CONCURRENCY_ERRORS_TO_RETRY = (errorcodes.DEADLOCK_DETECTED, errorcodes.LOCK_NOT_AVAILABLE)
+CONCURRENCY_MAX_RETRIES = 3
+CONCURRENCY_BACKOFF = 0.05
+CONCURRENCY_RETRY_MSG = 'Concurrency error (%s), retrying in %.3fs'
 
 class TelecomAPIService(models.AbstractModel):
     _name = 'telecom.api.service'
 
+    def _prefetch_write_params(self, vals_list):
+        """
+            Prefetch the Companies referenced by a batch
+            Returns the lookups used by the validators instead of searching once per record.
+            Telecom Service Templates are not prefetched, their lookups are cached by product.template.
+        """
+        ResCompany = self.env['res.company']
+
+        company_ids = set()
+        for vals in vals_list:
+            try:
+                company_ids.add(int(vals.get('company_id', False)))
+            except:
+                pass
+        company_ids.discard(0)
+
+        return {
+            'company_ids': set(ResCompany.search([('id', 'in', list(company_ids))]).ids) if company_ids else set(),
+        }
+
     def _validate_telecom_service(self, kwargs, create=False):
         """
             Validate Telecom Service Template ID or Name
@@ -43,24 +171,19 @@ class TelecomAPIService(models.AbstractModel):
             except:
                 raise UserError(INVALID_TELECOM_SERVICE_MSG)
             
-            product_tmpl_id = ProductTemplate.search([
-                ('id', '=', product_tmpl_id),
-                ('categ_id.parent_id', '=', self.env.ref('somit_telecom.product_category_telecom').id)
-            ]).id
+            product_tmpl_id = ProductTemplate._get_telecom_service_id(product_tmpl_id)
             if not product_tmpl_id:
                 # Search by name
                 telecom_service_name = str(telecom_service_name).strip()
                 if telecom_service_name:
-                    product_tmpl_id = ProductTemplate.search([
-                        ('name', '=', telecom_service_name)
-                    ], limit=1).id
+                    product_tmpl_id = ProductTemplate._get_template_id_by_name(telecom_service_name)
 
             if not product_tmpl_id:
                 raise UserError(UNKNOWN_TELECOM_SERVICE_MSG)
 
             kwargs['product_tmpl_id'] = product_tmpl_id
 
-    def _validate_company_id(self, kwargs, create=False):
+    def _validate_company_id(self, kwargs, create=False, lookups=None):
         """
             Validate Company ID
             Update vals with the correct company_id or use the current user's company.
@@ -80,7 +203,10 @@ class TelecomAPIService(models.AbstractModel):
                 company_id = self.env.user.company_id.id
             
 
-            company_id = ResCompany.search([('id', '=', company_id)]).id
+            if lookups is not None:
+                company_id = company_id if company_id in lookups['company_ids'] else False
+            else:
+                company_id = ResCompany.search([('id', '=', company_id)]).id
             if not company_id:
                 company_id = self.env.user.company_id.id
 
@@ -97,7 +223,7 @@ class TelecomAPIService(models.AbstractModel):
         elif not consumption_timestamp and create:
             raise UserError(MISSING_DATE_MSG)
         else:
-            consumption_timestamp = parse_dates(consumption_timestamp)
+            consumption_timestamp = parse_dates(consumption_timestamp, self.env.uid)
             if not consumption_timestamp:
                 raise UserError(INVALID_DATE_FORMAT_MSG)
 
@@ -116,86 +242,729 @@ class TelecomAPIService(models.AbstractModel):
         else:
             try:
                 consumption_qty = int(consumption_qty)
-                if consumption_qty <= 0:
+                if consumption_qty <= 0 or consumption_qty > CONSUMPTION_QTY_MAX:
                     raise UserError(INVALID_CONSUMPTION_QTY_MSG)
             except:
                 raise UserError(INVALID_CONSUMPTION_QTY_MSG)
 
             kwargs['consumption_qty'] = consumption_qty
 
-    def _validate_write_params(self, kwargs, create=False):
+    def _validate_telecom_service_company(self, kwargs):
+        """
+            Validate that the Telecom Service Template can be used by the Company of the consumption
+            Raise an error instead of letting the company check of create fail the whole batch
+        """
+        ProductTemplate = self.env['product.template'].sudo()
+
+        if not kwargs.get('product_tmpl_id', False) or not kwargs.get('company_id', False):
+            return
+        template_company_id = ProductTemplate.browse(kwargs['product_tmpl_id']).company_id.id
+        if template_company_id and template_company_id != kwargs['company_id']:
+            raise UserError(INVALID_TELECOM_SERVICE_COMPANY_MSG)
+
+    def _validate_client_reference(self, kwargs, create=False):
+        """
+            Validate Client Reference
+            Update vals with the stripped client_reference or raise an error, it is only used on creation
+        """
+        client_reference = kwargs.get('client_reference', False)
+        if not client_reference or not create:
+            return
+
+        client_reference = str(client_reference).strip()
+        if not client_reference or len(client_reference) > CLIENT_REFERENCE_MAX_LENGTH:
+            raise UserError(INVALID_CLIENT_REFERENCE_MSG % CLIENT_REFERENCE_MAX_LENGTH)
+
+        kwargs['client_reference'] = client_reference
+
+    def _validate_write_params(self, kwargs, create=False, lookups=None):
         """
             Validate Write Parameters
             Update vals with the correct values or raise an error
+            Pass the result of _prefetch_write_params as lookups to avoid per record searches
         """
-        self._validate_company_id(kwargs, create)
+        self._validate_company_id(kwargs, create, lookups)
         self._validate_telecom_service(kwargs, create)
+        self._validate_telecom_service_company(kwargs)
         self._validate_consumption_qty(kwargs, create)
         self._validate_consumption_timestamp(kwargs, create)
+        self._validate_client_reference(kwargs, create)
             
+    def _validate_read_fields(self, kwargs):
+        """
+            Validate the fields requested by the client
+            Returns the list of fields to read or raise an error
+        """
+        Consumption = self.env['telecom.service.consumption']
+
+        fields_list = kwargs.get('fields', False) or READ_DEFAULT_FIELDS
+        if isinstance(fields_list, str):
+            fields_list = [field.strip() for field in fields_list.split(',') if field.strip()]
+        if not isinstance(fields_list, list):
+            raise UserError(INVALID_READ_FIELDS_MSG % fields_list)
+        invalid_fields = [field for field in fields_list if field not in Consumption._fields]
+        if invalid_fields:
+            raise UserError(INVALID_READ_FIELDS_MSG % ', '.join(map(str, invalid_fields)))
+
+        return fields_list
+
+    @metrics.instrument_phase('read')
+    def _read_consumptions(self, consumptions, fields_list):
+        """
+            Serialize the consumptions with only the requested fields
+            When only the id is requested the records are not read at all
+        """
+        if fields_list == ['id']:
+            return [{'id': consumption_id} for consumption_id in consumptions.ids]
+        return consumptions.read(fields_list)
+
+    def _compact_records(self, records, fields_list):
+        """
+            Turn read records into column arrays: {'fields', 'columns', 'names'}
+            Many2one [id, name] pairs become ids, names holds the name of every id once per field.
+        """
+        Consumption = self.env['telecom.service.consumption']
+
+        field_names = ['id'] + [field for field in fields_list if field != 'id']
+        columns = {field: [] for field in field_names}
+        names = {field: {} for field in field_names if Consumption._fields[field].type == 'many2one'}
+        for record in records:
+            for field in field_names:
+                value = record[field]
+                if field in names and value:
+                    names[field][value[0]] = value[1]
+                    value = value[0]
+                columns[field].append(value)
+        return {'fields': field_names, 'columns': columns, 'names': names}
+
+    def _get_reference_key(self, vals):
+        """
+            Get the (company, client reference) idempotency key of a consumption vals, False if it has none
+        """
+        if not vals.get('client_reference', False):
+            return False
+        return (vals.get('company_id', False) or self.env.company.id, vals['client_reference'])
+
+    def _create_missing_references(self, vals_list):
+        """
+            Create the consumptions whose client reference does not exist yet
+            Returns the (id, duplicate) pair of each vals, in the same order
+        """
+        Consumption = self.env['telecom.service.consumption']
+
+        keys = [self._get_reference_key(vals) for vals in vals_list]
+        existing = {
+            (consumption.company_id.id, consumption.client_reference): consumption.id
+            for consumption in Consumption.search([
+                ('company_id', 'in', list({key[0] for key in keys if key})),
+                ('client_reference', 'in', list({key[1] for key in keys if key})),
+            ])
+        }
+
+        results, create_indexes, first_indexes = [None] * len(vals_list), [], {}
+        for index, key in enumerate(keys):
+            if key and key in existing:
+                results[index] = (existing[key], True)
+            elif key and key in first_indexes:
+                # Repeated within the same batch, it will get the id of the first one
+                continue
+            else:
+                if key:
+                    first_indexes[key] = index
+                create_indexes.append(index)
+
+        records = Consumption.create([vals_list[index] for index in create_indexes])
+        for index, consumption_id in zip(create_indexes, records.ids):
+            results[index] = (consumption_id, False)
+        for index, key in enumerate(keys):
+            if results[index] is None:
+                results[index] = (results[first_indexes[key]][0], True)
+
+        return results
+
+    def _create_idempotent(self, vals_list):
+        """
+            Create the consumptions, except the ones whose client reference already exists
+            Returns the (id, duplicate) pair of each vals, in the same order
+        """
+        Consumption = self.env['telecom.service.consumption']
+
+        if not any(vals.get('client_reference', False) for vals in vals_list):
+            return [(consumption_id, False) for consumption_id in Consumption.create(vals_list).ids]
+
+        try:
+            with self.env.cr.savepoint():
+                return self._create_missing_references(vals_list)
+        except IntegrityError as e:
+            if e.pgcode != errorcodes.UNIQUE_VIOLATION or e.diag.constraint_name != CLIENT_REFERENCE_CONSTRAINT:
+                raise
+            # The snapshot of this transaction (repeatable read) can not see the references committed meanwhile,
+            # searching them again would fail the same way: only a new transaction finds them
+            raise ClientReferenceConflict(CLIENT_REFERENCE_CONFLICT_MSG) from e
+
+    def _create_batch_items(self, vals_list):
+        """
+            Create the consumptions one by one, each from its own savepoint
+            Used when the batch insert fails, returns the (id, duplicate) pair or the error of each vals
+        """
+        results = []
+        for vals in vals_list:
+            try:
+                results.append(self._retry_concurrency_errors(self._create_idempotent, [vals])[0])
+            except Exception as e:
+                if isinstance(e, OperationalError) and e.pgcode in PG_CONCURRENCY_ERRORS_TO_RETRY:
+                    raise
+                results.append(e)
+        return results
+
+    def _retry_concurrency_errors(self, method, *args):
+        """
+            Call method from a savepoint, retrying it with an exponential backoff on deadlocks and lock timeouts
+        """
+        for attempt in range(CONCURRENCY_MAX_RETRIES + 1):
+            try:
+                with self.env.cr.savepoint():
+                    return method(*args)
+            except OperationalError as e:
+                if e.pgcode not in CONCURRENCY_ERRORS_TO_RETRY or attempt == CONCURRENCY_MAX_RETRIES:
+                    raise
+                delay = CONCURRENCY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+                _logger.info(CONCURRENCY_RETRY_MSG, errorcodes.lookup(e.pgcode), delay)
+                time.sleep(delay)
+
     @api.model
+    @metrics.instrument
     def create_consumption(self, **kwargs):
         Consumption = self.env['telecom.service.consumption']
-        self._validate_write_params(kwargs, create=True)
+        with metrics.measure(self.env, 'validation'):
+            fields_list = self._validate_read_fields(kwargs)
+            self._validate_write_params(kwargs, create=True)
 
         # Filter out non-writeable fields
-        vals = {key: kwargs[key] for key in kwargs.keys() if key in WRITEABLE_FIELDS}
+        vals = {key: kwargs[key] for key in kwargs.keys() if key in CREATE_FIELDS}
+
+        with metrics.measure(self.env, 'write', flush=True):
+            consumption_id, _duplicate = self._retry_concurrency_errors(self._create_idempotent, [vals])[0]
+        return self._read_consumptions(Consumption.browse(consumption_id), fields_list)
+
+    @api.model
+    @metrics.instrument
+    def create_consumption_batch(self, consumptions):
+        """
+            Create many consumptions at once
+            All the items are validated together and inserted with a single create call, if it fails
+            the items are inserted one by one to report the error of each of them.
+            Returns one result per item, in the same order, with either the new id or the error.
+        """
+        if not isinstance(consumptions, list):
+            raise UserError(INVALID_BATCH_MSG)
+        if len(consumptions) > SERVICE_CONSUMPTIONS_BATCH_LIMIT:
+            raise UserError(BATCH_LIMIT_EXCEEDED_MSG % SERVICE_CONSUMPTIONS_BATCH_LIMIT)
 
-        consumption = Consumption.create(vals)
-        return consumption.read()
+        results, vals_list, valid_indexes = [], [], []
+        # The whole batch is measured once, measuring every item would cost more than validating it
+        with metrics.measure(self.env, 'validation'):
+            lookups = self._prefetch_write_params([item for item in consumptions if isinstance(item, dict)])
+            for index, item in enumerate(consumptions):
+                if not isinstance(item, dict):
+                    results.append({'index': index, 'success': False, 'error': INVALID_BATCH_ITEM_MSG})
+                    continue
+                kwargs = dict(item)
+                try:
+                    self._validate_write_params(kwargs, create=True, lookups=lookups)
+                except UserError as e:
+                    results.append({'index': index, 'success': False, 'error': str(e)})
+                    continue
+
+                # Filter out non-writeable fields
+                vals_list.append({key: kwargs[key] for key in kwargs.keys() if key in CREATE_FIELDS})
+                valid_indexes.append(index)
+                results.append({'index': index, 'success': True, 'id': False})
+
+        if vals_list:
+            with metrics.measure(self.env, 'write', flush=True):
+                try:
+                    created = self._retry_concurrency_errors(self._create_idempotent, vals_list)
+                except Exception as e:
+                    if isinstance(e, OperationalError) and e.pgcode in PG_CONCURRENCY_ERRORS_TO_RETRY:
+                        raise
+                    created = self._create_batch_items(vals_list)
+            for index, result in zip(valid_indexes, created):
+                if isinstance(result, Exception):
+                    results[index] = {'index': index, 'success': False, 'error': str(result)}
+                    continue
+                consumption_id, duplicate = result
+                results[index]['id'] = consumption_id
+                if duplicate:
+                    results[index]['duplicate'] = True
+
+        return results
     
     @api.model
-    def get_consumption(self, id):
+    @metrics.instrument
+    def create_consumption_async(self, consumptions):
+        """
+            Accept consumptions to be created later by the staging cron
+            Only the shape of the payload is checked here, the full validation runs when they are processed.
+            Returns the ticket to poll with get_ticket_status.
+        """
+        ConsumptionStaging = self.env['telecom.service.consumption.staging'].sudo()
+
+        if not isinstance(consumptions, list) or not consumptions:
+            raise UserError(INVALID_BATCH_MSG)
+        if len(consumptions) > SERVICE_CONSUMPTIONS_BATCH_LIMIT:
+            raise UserError(BATCH_LIMIT_EXCEEDED_MSG % SERVICE_CONSUMPTIONS_BATCH_LIMIT)
+        if not all(isinstance(item, dict) for item in consumptions):
+            raise UserError(INVALID_BATCH_ITEM_MSG)
+
+        ticket = uuid.uuid4().hex
+        with metrics.measure(self.env, 'write', flush=True):
+            ConsumptionStaging.create([
+                {
+                    'ticket': ticket,
+                    'sequence': index,
+                    'user_id': self.env.uid,
+                    'payload': {key: item[key] for key in item.keys() if key in CREATE_FIELDS + ['telecom_service_name']},
+                }
+                for index, item in enumerate(consumptions)
+            ])
+
+        return {'ticket': ticket, 'state': 'pending'}
+
+    @api.model
+    @metrics.instrument
+    def get_ticket_status(self, ticket):
+        """
+            Get the processing state of the consumptions sent with a ticket
+            The ticket is pending until every consumption has been processed.
+        """
+        ConsumptionStaging = self.env['telecom.service.consumption.staging'].sudo()
+
+        stagings = ConsumptionStaging.search([('ticket', '=', ticket), ('user_id', '=', self.env.uid)], order='sequence')
+        if not stagings:
+            raise UserError(MISSING_TICKET_MSG)
+
+        return {
+            'ticket': ticket,
+            'state': 'pending' if 'pending' in stagings.mapped('state') else 'done',
+            'items': [
+                {
+                    'index': staging.sequence,
+                    'state': staging.state,
+                    'id': staging.consumption_id.id,
+                    'error': staging.error or False,
+                }
+                for staging in stagings
+            ],
+        }
+
+    @api.model
+    @metrics.instrument
+    def get_consumption(self, id, if_none_match=False, with_etag=False, **kwargs):
+        """
+            Get a consumption
+            With with_etag the (etag, result) pair is returned instead, result is None when the etag
+            matches if_none_match: the consumption is then not read at all.
+        """
         Consumption = self.env['telecom.service.consumption']
         
         # Check that the consumption exists
-        consumption_id = Consumption.search([('id', '=', id)], limit=1).id
+        with metrics.measure(self.env, 'validation'):
+            fields_list = self._validate_read_fields(kwargs)
+            consumption_id = Consumption.search([('id', '=', id)], limit=1).id
         if not consumption_id:
             raise UserError(MISSING_CONSUMPTION_MSG)
-        
-        return Consumption.browse(id).read()
+
+        consumption = Consumption.browse(id)
+        if not with_etag:
+            return self._read_consumptions(consumption, fields_list)
+
+        etag = self._get_etag(consumption, fields_list)
+        if self._is_not_modified(etag, if_none_match):
+            return etag, None
+        return etag, self._read_consumptions(consumption, fields_list)
     
+    def _get_etag(self, consumptions, *extra):
+        """
+            Compute the ETag of a response from the ids and write dates of its consumptions
+            The write dates of their templates, categories and companies are included too,
+            their display names are part of the response.
+            extra holds anything else the response depends on (requested fields, totals...)
+        """
+        versions = []
+        if consumptions:
+            consumptions.flush_recordset(['write_date'])
+            for model in ('product.template', 'product.category', 'res.company'):
+                self.env[model].flush_model(['write_date'])
+            self.env.cr.execute("""
+                SELECT consumption.id, consumption.write_date, template.write_date, category.write_date, company.write_date
+                FROM telecom_service_consumption consumption
+                LEFT JOIN product_template template ON template.id = consumption.product_tmpl_id
+                LEFT JOIN product_category category ON category.id = consumption.category_id
+                LEFT JOIN res_company company ON company.id = consumption.company_id
+                WHERE consumption.id IN %s
+            """, (tuple(consumptions.ids),))
+            write_dates = {row[0]: row[1:] for row in self.env.cr.fetchall()}
+            versions = [(consumption_id, write_dates.get(consumption_id)) for consumption_id in consumptions.ids]
+
+        return '"%s"' % hashlib.md5(json.dumps([versions, extra], default=str).encode()).hexdigest()
+
+    def _is_not_modified(self, etag, if_none_match):
+        """
+            Check if the ETag matches the If-None-Match header sent by the client, compressed or not
+        """
+        return bool(compression.match_etag(etag, if_none_match))
+
+    def _encode_cursor(self, consumption):
+        """
+            Build the opaque cursor pointing right after the given consumption
+        """
+        key = [fields.Datetime.to_string(consumption.consumption_timestamp), consumption.id]
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+    def _decode_cursor(self, cursor):
+        """
+            Get the domain of the consumptions after the given cursor or raise an error
+        """
+        try:
+            consumption_timestamp, consumption_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            consumption_timestamp = fields.Datetime.to_datetime(consumption_timestamp)
+            consumption_id = int(consumption_id)
+        except:
+            raise UserError(INVALID_CURSOR_MSG)
+
+        # The redundant upper bound gives the timestamp indexes a range condition,
+        # PostgreSQL cannot get one from the OR alone and would scan from the newest consumption
+        return [
+            ('consumption_timestamp', '<=', consumption_timestamp),
+            '|',
+                ('consumption_timestamp', '<', consumption_timestamp),
+                '&', ('consumption_timestamp', '=', consumption_timestamp), ('id', '<', consumption_id)
+        ]
+
     @api.model
-    def get_consumption_list(self, **kwargs):
+    @metrics.instrument
+    def get_consumption_list(self, if_none_match=False, with_etag=False, **kwargs):
+        """
+            Get a page of consumptions
+            With with_etag the (etag, result) pair is returned instead, result is None when the etag
+            matches if_none_match: the consumptions are then not read at all.
+            With row_format='compact' the records are sent as column arrays (see _compact_records).
+        """
         Consumption = self.env['telecom.service.consumption']
         limit = kwargs.get('limit', 10)
         offset = kwargs.get('offset', 0)
-        date_filter = parse_dates(kwargs.get('date_filter', False))
+        with metrics.measure(self.env, 'validation'):
+            fields_list = self._validate_read_fields(kwargs)
         
+        domain = self._get_list_domain(kwargs)
+        count_mode = kwargs.get('count', False)
+        if count_mode and count_mode not in COUNT_MODES:
+            raise UserError(INVALID_COUNT_MODE_MSG % ', '.join(COUNT_MODES))
+        row_format = kwargs.get('row_format', False)
+        if row_format and row_format not in ROW_FORMATS:
+            raise UserError(INVALID_ROW_FORMAT_MSG % ', '.join(ROW_FORMATS))
+
+        cursor_pagination = kwargs.get('pagination', False) == CURSOR_PAGINATION
+        if not cursor_pagination:
+            with metrics.measure(self.env, 'search'):
+                consumptions = Consumption.search(domain, limit=limit, offset=offset, order=Consumption._order)
+            has_next = False
+        else:
+            # Keyset pagination: the cost of a page does not depend on how deep it is
+            # The cursor only narrows the search, the totals count every page
+            cursor = kwargs.get('cursor', False)
+            search_domain = domain + self._decode_cursor(cursor) if cursor else domain
+
+            # Fetch one more record to know if there is a next page
+            with metrics.measure(self.env, 'search'):
+                consumptions = Consumption.search(search_domain, limit=limit + 1, order=CURSOR_ORDER)
+            has_next = len(consumptions) > limit
+            consumptions = consumptions[:limit]
+
+        total = self._count_consumptions(domain, count_mode) if count_mode else {}
+
+        etag = False
+        if with_etag:
+            etag = self._get_etag(consumptions, fields_list, cursor_pagination, has_next, total, row_format)
+            if self._is_not_modified(etag, if_none_match):
+                return etag, None
+
+        records = self._read_consumptions(consumptions, fields_list)
+        if row_format == ROW_FORMAT_COMPACT:
+            records = self._compact_records(records, fields_list)
+        if not cursor_pagination:
+            result = dict(total, records=records) if count_mode else records
+        else:
+            result = dict(total, records=records, next_cursor=self._encode_cursor(consumptions[-1]) if has_next else False)
+        return (etag, result) if with_etag else result
+    
+    def _count_consumptions(self, domain, count_mode):
+        """
+            Count the consumptions matching the domain, exactly or with the query planner estimate
+            Returns the total and the mode used to get it
+        """
+        Consumption = self.env['telecom.service.consumption']
+
+        with metrics.measure(self.env, 'count'):
+            if count_mode != 'exact':
+                query_str, params = Consumption._search(domain).select()
+                self.env.cr.execute('EXPLAIN (FORMAT JSON) ' + query_str, params)
+                estimate = int(self.env.cr.fetchone()[0][0]['Plan']['Plan Rows'])
+                if count_mode == 'estimate' or estimate > COUNT_EXACT_THRESHOLD:
+                    return {'total': estimate, 'total_mode': 'estimate'}
+
+            return {'total': Consumption.search_count(domain), 'total_mode': 'exact'}
+
+    def _get_list_domain(self, kwargs):
+        """
+            Build the domain of the list filters (see LIST_FILTERS) or raise an error
+            The filters map onto indexed fields, combined with the consumption_timestamp order.
+        """
+        date_filter = parse_dates(kwargs.get('date_filter', False), self.env.uid)
         domain = [('consumption_timestamp', '>=', date_filter)] if date_filter else []
-        return Consumption.search(
+        domain += self._get_date_range_domain(kwargs)
+
+        for key, (field, operator, value_type) in LIST_FILTERS.items():
+            value = kwargs.get(key, False)
+            if value is False or value is None or value == []:
+                continue
+            try:
+                if operator == 'in':
+                    value = [value_type(item) for item in (value if isinstance(value, list) else [value])]
+                else:
+                    value = value_type(value)
+            except (TypeError, ValueError):
+                raise UserError(INVALID_FILTER_MSG % key)
+            domain.append((field, operator, value))
+
+        return domain
+
+    def _get_date_range_domain(self, kwargs):
+        """
+            Build the consumption_timestamp domain from date_from and date_to or raise an error
+        """
+        domain = []
+        for key, operator in [('date_from', '>='), ('date_to', '<=')]:
+            if kwargs.get(key, False):
+                date = parse_dates(kwargs[key], self.env.uid)
+                if not date:
+                    raise UserError(INVALID_DATE_FORMAT_MSG)
+                domain.append(('consumption_timestamp', operator, date))
+
+        return domain
+
+    @api.model
+    @metrics.instrument
+    def get_consumption_totals(self, **kwargs):
+        """
+            Sum the consumption quantities grouped by product, category code, company and/or time bucket
+            The aggregation runs in the database (GROUP BY), only the totals are sent back.
+            With source='daily' the totals are read from the daily rollup, dates are then whole UTC days
+            and the latest consumptions are only included once the cron has flushed them (every minute).
+        """
+        daily = kwargs.get('source', False) == AGGREGATE_SOURCE_DAILY
+        Model = self.env['telecom.service.consumption.daily' if daily else 'telecom.service.consumption']
+        date_field = 'consumption_date' if daily else 'consumption_timestamp'
+
+        groupby = kwargs.get('groupby', False) or []
+        if isinstance(groupby, str):
+            groupby = [key.strip() for key in groupby.split(',') if key.strip()]
+        invalid_groupby = [key for key in groupby if key not in AGGREGATE_GROUPBY]
+        if invalid_groupby:
+            raise UserError(INVALID_GROUPBY_MSG % (', '.join(map(str, invalid_groupby)), ', '.join(AGGREGATE_GROUPBY)))
+
+        time_buckets = AGGREGATE_DAILY_TIME_BUCKETS if daily else AGGREGATE_TIME_BUCKETS
+        time_bucket = kwargs.get('time_bucket', False)
+        if time_bucket and time_bucket not in time_buckets:
+            raise UserError(INVALID_TIME_BUCKET_MSG % ', '.join(time_buckets))
+        if time_bucket:
+            groupby = groupby + ['%s:%s' % (date_field, time_bucket)]
+
+        domain = self._get_date_range_domain(kwargs)
+        if daily:
+            domain = [(date_field, operator, date.date()) for _field, operator, date in domain]
+
+        groups = Model.read_group(
             domain,
-            limit=limit,
-            offset=offset,
-            order=Consumption._order
-        ).read()
-    
+            ['consumption_qty:sum', 'consumption_count:sum'] if daily else ['consumption_qty:sum'],
+            groupby,
+            lazy=False
+        )
+
+        totals = []
+        for group in groups:
+            total = {key: group[key] for key in groupby if not key.startswith(date_field)}
+            if time_bucket:
+                # Use the bucket start instead of the localized label
+                total['consumption_timestamp'] = group['__range']['%s:%s' % (date_field, time_bucket)]['from']
+            total['consumption_qty'] = group['consumption_qty']
+            total['count'] = group['consumption_count'] if daily else group['__count']
+            totals.append(total)
+
+        return totals
+
+    def _validate_export_params(self, kwargs):
+        """
+            Validate Export Parameters
+            Returns the export format, fields and domain or raise an error
+        """
+        export_format = kwargs.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise UserError(INVALID_EXPORT_FORMAT_MSG % ', '.join(EXPORT_FORMATS))
+
+        fields_list = kwargs.get('fields', False) or EXPORT_DEFAULT_FIELDS
+        if isinstance(fields_list, str):
+            fields_list = [field.strip() for field in fields_list.split(',') if field.strip()]
+        invalid_fields = [field for field in fields_list if field not in EXPORT_FIELDS]
+        if invalid_fields:
+            raise UserError(INVALID_EXPORT_FIELDS_MSG % (', '.join(invalid_fields), ', '.join(EXPORT_FIELDS)))
+
+        return export_format, fields_list, self._get_list_domain(kwargs)
+
+    def _format_export_rows(self, rows, fields_list, export_format, header=False):
+        """
+            Serialize a chunk of rows to NDJSON or CSV
+        """
+        rows = [
+            [fields.Datetime.to_string(value) if isinstance(value, datetime) else value for value in row]
+            for row in rows
+        ]
+        if export_format == 'ndjson':
+            return ''.join(json.dumps(dict(zip(fields_list, row))) + '\n' for row in rows).encode()
+
+        output = io.StringIO()
+        writer = csv.writer(output)
+        if header:
+            writer.writerow(fields_list)
+        writer.writerows(rows)
+        return output.getvalue().encode()
+
+    def export_consumptions(self, export_format, fields_list, domain):
+        """
+            Stream the consumptions matching the domain in chunks of EXPORT_CHUNK_SIZE rows
+            Rows are fetched through a server-side cursor so memory does not grow with the export size.
+        """
+        Consumption = self.env['telecom.service.consumption']
+        Consumption.check_access_rights('read')
+
+        query = Consumption._where_calc(domain)
+        Consumption._apply_ir_rules(query, 'read')
+        query.order = '"%(table)s"."consumption_timestamp", "%(table)s"."id"' % {'table': Consumption._table}
+        query_str, params = query.select(*['"%s"."%s"' % (Consumption._table, field) for field in fields_list])
+
+        if export_format == 'csv':
+            yield self._format_export_rows([], fields_list, export_format, header=True)
+
+        with self.env.cr._cnx.cursor('telecom_service_consumption_export') as server_cr:
+            server_cr.itersize = EXPORT_CHUNK_SIZE
+            server_cr.execute(query_str, params)
+            while True:
+                rows = server_cr.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                yield self._format_export_rows(rows, fields_list, export_format)
+
     @api.model
+    @metrics.instrument
     def update_consumption(self, id, **kwargs):
         Consumption = self.env['telecom.service.consumption']
         
         # Check that the consumption exists
-        consumption_id = Consumption.search([('id', '=', id)], limit=1).id
+        with metrics.measure(self.env, 'validation'):
+            consumption_id = Consumption.search([('id', '=', id)], limit=1).id
         if not consumption_id:
             raise UserError(MISSING_CONSUMPTION_MSG)
         
-        self._validate_write_params(kwargs)
+        with metrics.measure(self.env, 'validation'):
+            fields_list = self._validate_read_fields(kwargs)
+            self._validate_write_params(kwargs)
 
         # Filter out non-writeable fields
         vals = {key: kwargs[key] for key in kwargs.keys() if key in WRITEABLE_FIELDS}
 
         consumption = Consumption.browse(id)
-        consumption.write(vals)
-        return consumption.read()
+        with metrics.measure(self.env, 'write', flush=True):
+            consumption.write(vals)
+        return self._read_consumptions(consumption, fields_list)
     
     @api.model
+    @metrics.instrument
     def delete_consumption(self, id):
         Consumption = self.env['telecom.service.consumption']
         
         # Check that the consumption exists
-        consumption_id = Consumption.search([('id', '=', id)], limit=1).id
+        with metrics.measure(self.env, 'validation'):
+            consumption_id = Consumption.search([('id', '=', id)], limit=1).id
         if not consumption_id:
             raise UserError(MISSING_CONSUMPTION_MSG)
         
-        Consumption.browse(id).unlink()
-        return True
\ No newline at end of file
+        with metrics.measure(self.env, 'write', flush=True):
+            Consumption.browse(id).unlink()
+        return True
+
+    def _get_bulk_consumptions(self, ids=False, filters=False):
+        """
+            Select the consumptions of a bulk operation by id list or by list filters (see LIST_FILTERS)
+            Returns the consumptions found and the requested ids that do not exist, with a single query.
+        """
+        Consumption = self.env['telecom.service.consumption']
+
+        if ids:
+            if not isinstance(ids, list):
+                raise UserError(INVALID_BULK_IDS_MSG)
+            try:
+                ids = [int(consumption_id) for consumption_id in ids]
+            except (TypeError, ValueError):
+                raise UserError(INVALID_BULK_IDS_MSG)
+            domain = [('id', 'in', ids)]
+        elif isinstance(filters, dict) and filters:
+            domain = self._get_list_domain(filters)
+        else:
+            domain = []
+        if not domain:
+            raise UserError(MISSING_BULK_SELECTION_MSG)
+
+        with metrics.measure(self.env, 'validation'):
+            consumptions = Consumption.search(domain, limit=SERVICE_CONSUMPTIONS_BULK_LIMIT + 1, order='id')
+        if len(consumptions) > SERVICE_CONSUMPTIONS_BULK_LIMIT:
+            raise UserError(BULK_LIMIT_EXCEEDED_MSG % SERVICE_CONSUMPTIONS_BULK_LIMIT)
+
+        found_ids = set(consumptions.ids)
+        missing_ids = [consumption_id for consumption_id in ids if consumption_id not in found_ids] if ids else []
+        return consumptions, missing_ids
+
+    @api.model
+    @metrics.instrument
+    def update_consumptions(self, ids=False, filters=False, values=False):
+        """
+            Write the same values on many consumptions at once, selected by id list or by filters
+            Returns the number of updated consumptions and the requested ids that do not exist.
+        """
+        if not isinstance(values, dict):
+            raise UserError(MISSING_BULK_VALUES_MSG)
+        kwargs = dict(values)
+        with metrics.measure(self.env, 'validation'):
+            self._validate_write_params(kwargs)
+
+        # Filter out non-writeable fields
+        vals = {key: kwargs[key] for key in kwargs.keys() if key in WRITEABLE_FIELDS}
+        if not vals:
+            raise UserError(MISSING_BULK_VALUES_MSG)
+
+        consumptions, missing_ids = self._get_bulk_consumptions(ids, filters)
+        with metrics.measure(self.env, 'write', flush=True):
+            consumptions.write(vals)
+        return {'updated': len(consumptions), 'missing_ids': missing_ids}
+
+    @api.model
+    @metrics.instrument
+    def delete_consumptions(self, ids=False, filters=False):
+        """
+            Delete many consumptions at once, selected by id list or by filters
+            Returns the number of deleted consumptions and the requested ids that do not exist.
+        """
+        consumptions, missing_ids = self._get_bulk_consumptions(ids, filters)
+        with metrics.measure(self.env, 'write', flush=True):
+            consumptions.unlink()
+        return {'deleted': len(consumptions), 'missing_ids': missing_ids}
@@ -0,0 +1,191 @@
+import csv
+import io
+import itertools
+import logging
+import threading
+from datetime import timezone
+
+from odoo import models, api, fields
+from odoo.exceptions import UserError
+
+from ..commons.utils import parse_dates
+
+
+_logger = logging.getLogger(__name__)
+
+
+# Import Constants
+IMPORT_FORMATS = ['csv', 'parquet']
+IMPORT_CHUNK_SIZE = 50000
+IMPORT_COLUMNS = [
+    'name', 'company_id', 'product_tmpl_id', 'category_id', 'category_code', 'consumption_timestamp', 'consumption_qty',
+    'create_uid', 'create_date', 'write_uid', 'write_date',
+]
+
+# Import Messages
+INVALID_IMPORT_FORMAT_MSG = 'Invalid import format %s. Available formats: %s.'
+MISSING_PYARROW_MSG = 'Importing Parquet files requires the pyarrow library.'
+UNKNOWN_TELECOM_SERVICE_MSG = 'Unknown Telecom Service Template'
+INVALID_DATE_FORMAT_MSG = 'Invalid date format'
+INVALID_CONSUMPTION_QTY_MSG = 'Invalid consumption quantity'
+UNKNOWN_COMPANY_MSG = 'Unknown company'
+IMPORT_CHUNK_MSG = 'Imported %s consumptions (%s rejected) from %s'
+
+
+class TelecomConsumptionImport(models.AbstractModel):
+    _name = 'telecom.consumption.import'
+    _description = 'Telecom Service Consumption Import'
+
+    def _get_product_map(self):
+        """
+            Map every Telecom Service Template id, name and default code to its (id, name, category, category code)
+            The whole catalogue is read once, rows are then resolved in memory.
+        """
+        ProductTemplate = self.env['product.template']
+
+        product_map = {}
+        templates = ProductTemplate.with_context(active_test=False).search([
+            ('categ_id.parent_id', '=', ProductTemplate._get_telecom_category_id())
+        ])
+        for template in templates:
+            product = (template.id, template.name, template.categ_id.id, template.categ_id.code or None)
+            product_map[('id', str(template.id))] = product
+            product_map.setdefault(('name', template.name), product)
+            if template.default_code:
+                product_map.setdefault(('code', template.default_code), product)
+        return product_map
+
+    def _prepare_rows(self, rows, product_map, company_id, company_ids):
+        """
+            Resolve, validate and normalize a chunk of rows
+            Rows without company_id get the given company, company_ids holds the ids of the existing ones
+            Returns the values to insert (see IMPORT_COLUMNS) and the (row number, error) of the rejected rows
+        """
+        now = fields.Datetime.now()
+        records, errors = [], []
+        for number, row in rows:
+            product = (
+                product_map.get(('id', str(row.get('product_tmpl_id') or '').strip()))
+                or product_map.get(('name', str(row.get('telecom_service_name') or '').strip()))
+                or product_map.get(('code', str(row.get('default_code') or '').strip()))
+            )
+            if not product:
+                errors.append((number, UNKNOWN_TELECOM_SERVICE_MSG))
+                continue
+
+            timestamp = parse_dates(row.get('consumption_timestamp'), 'import')
+            if not timestamp:
+                errors.append((number, INVALID_DATE_FORMAT_MSG))
+                continue
+            if timestamp.tzinfo:
+                timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+            timestamp = timestamp.replace(microsecond=0)
+
+            try:
+                qty = int(row.get('consumption_qty'))
+                if qty <= 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors.append((number, INVALID_CONSUMPTION_QTY_MSG))
+                continue
+
+            # COPY would fail the whole chunk on an unknown company
+            row_company_id = str(row.get('company_id') or '').strip()
+            if row_company_id and row_company_id not in company_ids:
+                errors.append((number, UNKNOWN_COMPANY_MSG))
+                continue
+
+            product_tmpl_id, product_name, category_id, category_code = product
+            records.append([
+                '%s - %s' % (product_name, timestamp),
+                int(row_company_id) if row_company_id else company_id,
+                product_tmpl_id,
+                category_id,
+                category_code,
+                timestamp,
+                qty,
+                self.env.uid, now, self.env.uid, now,
+            ])
+        return records, errors
+
+    def _copy_records(self, records):
+        """
+            Insert the records with COPY and add them to the daily totals and usage counters
+            Rows are copied to a temporary table first to get the ids of the new consumptions back.
+        """
+        columns = ', '.join(IMPORT_COLUMNS)
+        self.env.cr.execute("""
+            CREATE TEMPORARY TABLE IF NOT EXISTS telecom_consumption_import AS
+            SELECT %s FROM telecom_service_consumption WITH NO DATA;
+            TRUNCATE telecom_consumption_import
+        """ % columns)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([['\\N' if value is None else value for value in record] for record in records])
+        buffer.seek(0)
+        self.env.cr._obj.copy_expert(
+            "COPY telecom_consumption_import (%s) FROM STDIN WITH (FORMAT csv, NULL '\\N')" % columns, buffer
+        )
+        self.env.cr.execute(
+            'INSERT INTO telecom_service_consumption (%s) SELECT %s FROM telecom_consumption_import RETURNING id' % (columns, columns)
+        )
+
+        Consumption = self.env['telecom.service.consumption']
+        consumptions = Consumption.browse([row[0] for row in self.env.cr.fetchall()])
+        self.env['telecom.service.usage.delta']._add_consumptions(consumptions)
+        Consumption.invalidate_model()
+        return consumptions
+
+    def _read_file(self, path, file_format, chunk_size):
+        """
+            Stream the rows of a CSV or Parquet file as chunks of (row number, row) pairs
+        """
+        if file_format == 'csv':
+            with open(path, newline='') as f:
+                rows = enumerate(csv.DictReader(f), start=2)
+                while True:
+                    chunk = list(itertools.islice(rows, chunk_size))
+                    if not chunk:
+                        return
+                    yield chunk
+        else:
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise UserError(MISSING_PYARROW_MSG)
+            number = 1
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+                rows = batch.to_pylist()
+                yield list(enumerate(rows, start=number))
+                number += len(rows)
+
+    @api.model
+    def import_file(self, path, file_format='csv', chunk_size=IMPORT_CHUNK_SIZE, company_id=False):
+        """
+            Import the consumptions of a CSV or Parquet file, chunk by chunk
+            Columns: product_tmpl_id, telecom_service_name or default_code, consumption_timestamp,
+            consumption_qty and optionally company_id (ids of res.company).
+            Each chunk is committed on its own outside of tests.
+            Returns the number of imported rows and the (row number, error) of the rejected ones.
+        """
+        if file_format not in IMPORT_FORMATS:
+            raise UserError(INVALID_IMPORT_FORMAT_MSG % (file_format, ', '.join(IMPORT_FORMATS)))
+
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        product_map = self._get_product_map()
+        company_id = company_id or self.env.company.id
+        company_ids = {str(company.id) for company in self.env['res.company'].sudo().search([])}
+
+        imported, errors = 0, []
+        for chunk in self._read_file(path, file_format, chunk_size):
+            records, chunk_errors = self._prepare_rows(chunk, product_map, company_id, company_ids)
+            if records:
+                self._copy_records(records)
+            if auto_commit:
+                self.env.cr.commit()
+            imported += len(records)
+            errors += chunk_errors
+            _logger.info(IMPORT_CHUNK_MSG, imported, len(errors), path)
+
+        return imported, errors
@@ -0,0 +1,116 @@
+import base64
+import hmac
+import json
+import time
+import uuid
+from datetime import datetime
+
+from odoo import models, api, tools
+from odoo.exceptions import AccessDenied
+from odoo.tools import misc
+
+
+# Token Constants
+TOKEN_LIFETIME = 12 * 60 * 60
+TOKEN_SCOPE = 'somit_telecom.api_token'
+# res.users._compute_session_token is cached by sid, each user needs its own
+TOKEN_SID = 'somit_telecom.api_token.%s'
+
+# Token Messages
+INVALID_TOKEN_MSG = 'Invalid or expired token. Request a new token and try again.'
+
+
+class TelecomAPIToken(models.AbstractModel):
+    _name = 'telecom.api.token'
+    _description = 'Telecom Service API Tokens'
+
+    @tools.ormcache('uid')
+    def _get_signing_key(self, uid):
+        """
+            Get the key the tokens of the user are signed with, False if the user can not use tokens
+            The key is the session token of the user: it changes with its login, password and active state.
+            res.users clears this cache when they change, so verifying a token does not read the user.
+        """
+        user = self.env['res.users'].sudo().with_context(active_test=False).browse(uid).exists()
+        if not user.active:
+            return False
+        return user._compute_session_token(TOKEN_SID % uid)
+
+    @tools.ormcache('token_id')
+    def _is_revoked(self, token_id):
+        """
+            Check if a token has been revoked, revoke_token clears this cache
+        """
+        return bool(self.env['telecom.api.token.revocation'].sudo().search_count([('token_id', '=', token_id)]))
+
+    def _sign(self, payload, key):
+        """
+            Sign a token payload with the key of its user (see _get_signing_key)
+        """
+        return misc.hmac(self.env(su=True), TOKEN_SCOPE, '%s.%s' % (payload, key))
+
+    @api.model
+    def generate_token(self, uid):
+        """
+            Generate a signed bearer token for the user, valid for TOKEN_LIFETIME seconds
+            The token is self-contained: verifying it needs neither the password nor a session.
+        """
+        key = self._get_signing_key(uid)
+        if not key:
+            raise AccessDenied(message=INVALID_TOKEN_MSG)
+
+        expires_at = int(time.time()) + TOKEN_LIFETIME
+        payload = base64.urlsafe_b64encode(json.dumps({
+            'uid': uid,
+            'db': self.env.cr.dbname,
+            'exp': expires_at,
+            'jti': uuid.uuid4().hex,
+        }).encode()).decode()
+        return {'token': '%s.%s' % (payload, self._sign(payload, key)), 'expires_at': expires_at}
+
+    @api.model
+    def _decode_token(self, token):
+        """
+            Check the signature of a token, that its user can use tokens and that it has not been revoked
+            Returns the (uid, expiration, token id) triple, (False, 0, False) if the token is not valid.
+            The expiration is checked by the caller.
+        """
+        try:
+            payload, signature = token.split('.')
+            data = json.loads(base64.urlsafe_b64decode(payload.encode()))
+            uid, db, expires_at, token_id = int(data['uid']), data['db'], int(data['exp']), str(data['jti'])
+        except Exception:
+            return False, 0, False
+
+        if db != self.env.cr.dbname:
+            return False, 0, False
+        key = self._get_signing_key(uid)
+        if not key or not hmac.compare_digest(signature, self._sign(payload, key)) or self._is_revoked(token_id):
+            return False, 0, False
+        return uid, expires_at, token_id
+
+    @api.model
+    def verify_token(self, token):
+        """
+            Get the user of a bearer token or raise an error
+        """
+        uid, expires_at, _token_id = self._decode_token(token)
+        if not uid or expires_at < time.time():
+            raise AccessDenied(message=INVALID_TOKEN_MSG)
+        return uid
+
+    @api.model
+    def revoke_token(self, token):
+        """
+            Invalidate a token before its expiration, the other tokens of its user keep working
+        """
+        uid, expires_at, token_id = self._decode_token(token)
+        if not uid:
+            return False
+
+        self.env['telecom.api.token.revocation'].sudo().create({
+            'token_id': token_id,
+            'expires_at': datetime.utcfromtimestamp(expires_at),
+        })
+        self.clear_caches()
+        return True
@@ -1,6 +1,13 @@
 import requests
+import tempfile
+from unittest.mock import patch
 import json
+from psycopg2 import errorcodes, errors
+from odoo import api
+from odoo.exceptions import AccessDenied, UserError, ValidationError
 from odoo.tests.common import TransactionCase, tagged
+from ..commons import compression, metrics, utils
+from ..services import api_service
 from datetime import datetime, timedelta
 
 
@@ -66,6 +73,28 @@ class TestTelecomServiceConsumption(TransactionCase):
                 'consumption_qty': 10,
             })
 
+    def test_constraints_multi_create(self):
+        other_template = self.env['product.template'].create({'name': 'Not a telecom service', 'categ_id': self.env.ref('product.product_category_all').id})
+        valid = self.telecom_service_consumption_data
+        count = self.telecom_service_consumption.search_count([])
+        cases = [
+            ([dict(valid), dict(valid, consumption_qty=0)], 'Consumption Quantity must be greater than 0'),
+            ([dict(valid, consumption_qty=-5), dict(valid), dict(valid)], 'Consumption Quantity must be greater than 0'),
+            ([dict(valid), dict(valid, product_tmpl_id=other_template.id), dict(valid)], 'Telecom Service Template must be a Telecom Service'),
+            ([dict(valid, product_tmpl_id=other_template.id, consumption_qty=0) for _ in range(2)], 'Telecom Service Template must be a Telecom Service|Consumption Quantity must be greater than 0'),
+        ]
+        for vals_list, message in cases:
+            with self.assertRaisesRegex(ValueError, '^(%s)$' % message), self.cr.savepoint():
+                self.telecom_service_consumption.create(vals_list)
+        self.assertEqual(self.telecom_service_consumption.search_count([]), count, "Invalid batches should not create any consumption")
+
+        consumptions = self.telecom_service_consumption.create([dict(valid), dict(valid)])
+        self.assertEqual(len(consumptions), 2)
+        with self.assertRaisesRegex(ValueError, '^Consumption Quantity must be greater than 0$'), self.cr.savepoint():
+            consumptions.write({'consumption_qty': 0})
+        with self.assertRaisesRegex(ValueError, '^Telecom Service Template must be a Telecom Service$'), self.cr.savepoint():
+            consumptions.write({'product_tmpl_id': other_template.id})
+
     def test_last_month_filter(self):
         last_month = datetime.now() - timedelta(days=30)
         consumptions = self.env['telecom.service.consumption'].search([
@@ -144,3 +173,573 @@ class TestTelecomServiceConsumption(TransactionCase):
         
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.json().get('result'), "Record should be deleted")
+
+    def test_create_consumption_batch(self):
+        results = self.env['telecom.api.service'].create_consumption_batch([
+            {
+                'product_tmpl_id': self.telecom_service.id,
+                'consumption_timestamp': datetime.now().isoformat(),
+                'consumption_qty': 5,
+            },
+            {
+                'telecom_service_name': self.telecom_service.name,
+                'consumption_timestamp': datetime.now().isoformat(),
+                'consumption_qty': 6,
+            },
+            {
+                'product_tmpl_id': self.telecom_service.id,
+                'consumption_timestamp': datetime.now().isoformat(),
+            },
+        ])
+
+        self.assertEqual(len(results), 3, "One result per item should be returned")
+        self.assertTrue(results[0]['success'])
+        self.assertTrue(results[1]['success'])
+        self.assertFalse(results[2]['success'], "Items without quantity should fail")
+        consumptions = self.telecom_service_consumption.browse([results[0]['id'], results[1]['id']])
+        self.assertEqual(consumptions.mapped('consumption_qty'), [5, 6])
+        self.assertEqual(consumptions.product_tmpl_id, self.telecom_service)
+
+    def test_create_consumption_batch_item_errors(self):
+        ApiService = self.env['telecom.api.service']
+        Consumption = type(self.telecom_service_consumption)
+        company = self.env['res.company'].create({'name': 'Telecom Batch Company'})
+        self.telecom_service.company_id = self.env.company
+        item = {'product_tmpl_id': self.telecom_service.id, 'consumption_timestamp': datetime.now().isoformat(), 'consumption_qty': 5}
+
+        results = ApiService.create_consumption_batch([
+            dict(item),
+            dict(item, company_id=company.id),
+            dict(item, consumption_qty=2 ** 31),
+        ])
+        self.assertTrue(results[0]['success'])
+        self.assertEqual(results[1]['error'], api_service.INVALID_TELECOM_SERVICE_COMPANY_MSG)
+        self.assertEqual(results[2]['error'], api_service.INVALID_CONSUMPTION_QTY_MSG)
+
+        # Errors of the batch insert are reported per item, the other items are still created
+        create = Consumption.create
+        def create_rejecting(records, vals_list):
+            if any(vals['consumption_qty'] == 13 for vals in vals_list):
+                raise ValidationError('Rejected by a constraint')
+            return create(records, vals_list)
+
+        with patch.object(Consumption, 'create', create_rejecting):
+            results = ApiService.create_consumption_batch([dict(item), dict(item, consumption_qty=13), dict(item, consumption_qty=7)])
+        self.assertEqual([result['success'] for result in results], [True, False, True])
+        self.assertEqual(results[1]['error'], 'Rejected by a constraint')
+        consumptions = self.telecom_service_consumption.browse([results[0]['id'], results[2]['id']])
+        self.assertEqual(consumptions.exists().mapped('consumption_qty'), [5, 7])
+
+    def test_consumption_list_cursor_pagination(self):
+        ApiService = self.env['telecom.api.service']
+        self.telecom_service_consumption.create([dict(self.telecom_service_consumption_data) for _ in range(3)])
+        date_filter = self.telecom_service_consumption_data['consumption_timestamp'].isoformat()
+        expected = self.telecom_service_consumption.search(
+            [('consumption_timestamp', '>=', date_filter)], order='consumption_timestamp desc, id desc'
+        ).ids
+
+        ids, cursor = [], False
+        while True:
+            page = ApiService.get_consumption_list(limit=2, date_filter=date_filter, pagination='cursor', cursor=cursor)
+            ids += [record['id'] for record in page['records']]
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(ids, expected, "Cursor pages should cover every consumption exactly once")
+
+    def test_consumption_list_cursor_plan(self):
+        ApiService = self.env['telecom.api.service']
+        cursor = ApiService._encode_cursor(self.consumption_1)
+        query = self.telecom_service_consumption._search(ApiService._decode_cursor(cursor), limit=10, order='consumption_timestamp desc, id desc')
+        query_str, params = query.select()
+
+        # Without sequential scans the planner shows whether the cursor bounds an index scan
+        self.env.cr.execute('SET LOCAL enable_seqscan = off')
+        self.env.cr.execute('EXPLAIN ' + query_str, params)
+        plan = '\n'.join(row[0] for row in self.env.cr.fetchall())
+        self.env.cr.execute('SET LOCAL enable_seqscan = on')
+        self.assertRegex(plan, r'Index Cond: .*consumption_timestamp <=', "Deep cursor pages should be an index range scan")
+
+    def test_export_consumptions(self):
+        ApiService = self.env['telecom.api.service']
+        export_format, fields_list, domain = ApiService._validate_export_params({
+            'format': 'ndjson',
+            'fields': 'id,consumption_qty',
+            'date_from': self.telecom_service_consumption_data['consumption_timestamp'].isoformat(),
+        })
+        rows = [
+            json.loads(line)
+            for chunk in ApiService.export_consumptions(export_format, fields_list, domain)
+            for line in chunk.decode().splitlines()
+        ]
+
+        self.assertIn({'id': self.consumption_1.id, 'consumption_qty': 10}, rows, "Consumption should be exported")
+        with self.assertRaises(UserError):
+            ApiService._validate_export_params({'fields': 'id,telecom_service_name'})
+
+    def test_read_fields_projection(self):
+        ApiService = self.env['telecom.api.service']
+        result = ApiService.create_consumption(
+            product_tmpl_id=self.telecom_service.id,
+            consumption_timestamp=datetime.now().isoformat(),
+            consumption_qty=3,
+            fields=['id'],
+        )
+        self.assertEqual(list(result[0].keys()), ['id'], "Only the id should be returned")
+
+        result = ApiService.get_consumption(result[0]['id'], fields='consumption_qty,telecom_service_name')
+        self.assertEqual(result[0]['consumption_qty'], 3)
+        self.assertEqual(result[0]['telecom_service_name'], self.telecom_service.name)
+        self.assertNotIn('category_code', result[0])
+
+        with self.assertRaises(UserError):
+            ApiService.get_consumption(result[0]['id'], fields=['k_invalid_field'])
+
+    def test_consumption_totals(self):
+        date_from = self.telecom_service_consumption_data['consumption_timestamp']
+        consumptions = self.telecom_service_consumption.search([('consumption_timestamp', '>=', date_from)])
+        totals = self.env['telecom.api.service'].get_consumption_totals(
+            date_from=date_from.isoformat(),
+            groupby=['product_tmpl_id'],
+            time_bucket='day',
+        )
+
+        self.assertEqual(sum(total['consumption_qty'] for total in totals), sum(consumptions.mapped('consumption_qty')))
+        self.assertEqual(sum(total['count'] for total in totals), len(consumptions))
+        self.assertTrue(all('consumption_timestamp' in total and 'product_tmpl_id' in total for total in totals))
+
+    def test_consumption_daily_rollup(self):
+        ConsumptionDaily = self.env['telecom.service.consumption.daily']
+        UsageDelta = self.env['telecom.service.usage.delta']
+        consumption_date = self.consumption_1.consumption_timestamp.date()
+        domain = [
+            ('consumption_date', '=', consumption_date),
+            ('product_tmpl_id', '=', self.telecom_service.id),
+            ('company_id', '=', self.env.company.id),
+        ]
+        UsageDelta._flush_deltas()
+        daily = ConsumptionDaily.search(domain)
+        qty, count = daily.consumption_qty, daily.consumption_count
+
+        consumption = self.telecom_service_consumption.create(dict(self.telecom_service_consumption_data, consumption_qty=7))
+        UsageDelta._flush_deltas()
+        self.assertEqual((daily.consumption_qty, daily.consumption_count), (qty + 7, count + 1))
+
+        consumption.write({'consumption_qty': 2})
+        UsageDelta._flush_deltas()
+        self.assertEqual((daily.consumption_qty, daily.consumption_count), (qty + 2, count + 1))
+
+        consumption.unlink()
+        UsageDelta._flush_deltas()
+        self.assertEqual((daily.consumption_qty, daily.consumption_count), (qty, count))
+
+        ConsumptionDaily.rebuild()
+        self.assertEqual(sum(ConsumptionDaily.search(domain).mapped('consumption_qty')), qty, "Rebuild should match the incremental totals")
+
+    def test_create_consumption_precomputed(self):
+        consumption = self.telecom_service_consumption.create(self.telecom_service_consumption_data)
+        for fname in ['name', 'category_id', 'category_code']:
+            field = self.telecom_service_consumption._fields[fname]
+            self.assertTrue(field.precompute, "%s should be computed before the insert" % fname)
+            self.assertNotIn(consumption, self.env.records_to_compute(field), "%s should not be recomputed after the insert" % fname)
+        self.assertEqual(consumption.category_id, self.telecom_service.categ_id)
+        self.assertEqual(consumption.category_code, self.telecom_service.categ_id.code)
+        self.assertEqual(consumption.name, '%s - %s' % (self.telecom_service.name, consumption.consumption_timestamp))
+
+    def test_parse_dates(self):
+        uid, other_uid = self.env.uid, self.env.ref('base.user_admin').id
+        for client in (uid, other_uid):
+            self.addCleanup(utils._learned_formats.pop, client, None)
+            utils._learned_formats.pop(client, None)
+
+        # ISO-8601 and unix timestamps never go through dateutil
+        self.assertEqual(utils.parse_dates('2021-03-13T10:00:00', uid), datetime(2021, 3, 13, 10))
+        self.assertEqual(utils.parse_dates('1615629600', uid), datetime.fromtimestamp(1615629600))
+        self.assertEqual(utils.parse_dates(1615629600, uid), datetime.fromtimestamp(1615629600))
+        self.assertNotIn(uid, utils._learned_formats, "Only dates parsed by dateutil should teach a format")
+        self.assertFalse(utils.parse_dates('not a date', uid))
+
+        # The formats parsed by dateutil are learned per user
+        consumption = self.telecom_service_consumption.create(dict(self.telecom_service_consumption_data, consumption_timestamp='13/03/2021 10:00:00'))
+        self.assertEqual(consumption.consumption_timestamp, datetime(2021, 3, 13, 10))
+        self.assertEqual(utils._learned_formats[uid], ['%d/%m/%Y %H:%M:%S'])
+        self.assertEqual(utils._parse_learned_format('14/03/2021 10:00:00', uid), datetime(2021, 3, 14, 10))
+        self.assertFalse(utils._parse_learned_format('14/03/2021 10:00:00', other_uid))
+
+        # Ambiguous dates are left to dateutil, which reads them month first
+        self.assertFalse(utils._parse_learned_format('05/03/2021 10:00:00', uid))
+        self.assertEqual(utils.parse_dates('05/03/2021 10:00:00', uid), datetime(2021, 5, 3, 10))
+        self.assertEqual(utils.parse_dates('05/03/2021 10:00:00', other_uid), datetime(2021, 5, 3, 10))
+        self.assertEqual(utils._learned_formats[uid], ['%m/%d/%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S'])
+        self.assertEqual(utils.parse_dates('14/03/2021 10:00:00', uid), datetime(2021, 3, 14, 10))
+
+        # Only the most recently used formats are kept
+        for date in ('2021/03/13', '13.03.2021', '13-03-2021', '13 Mar 2021 10:00:00'):
+            utils.parse_dates(date, uid)
+        self.assertEqual(utils._learned_formats[uid], ['%d %b %Y %H:%M:%S', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d'])
+
+    def test_telecom_service_lookup_cache(self):
+        ProductTemplate = self.env['product.template']
+        self.assertEqual(ProductTemplate._get_telecom_service_id(self.telecom_service.id), self.telecom_service.id)
+        self.assertEqual(ProductTemplate._get_template_id_by_name(self.telecom_service.name), self.telecom_service.id)
+
+        self.telecom_service.name = 'Mobile data renamed'
+        self.assertEqual(ProductTemplate._get_template_id_by_name('Mobile data renamed'), self.telecom_service.id, "Renaming should invalidate the cache")
+
+        self.telecom_service.categ_id = self.env.ref('product.product_category_all')
+        self.assertFalse(ProductTemplate._get_telecom_service_id(self.telecom_service.id), "Moving out of Telecom should invalidate the cache")
+
+    def test_telecom_service_lookup_cache_scope(self):
+        ProductTemplate = self.env['product.template']
+        company = self.env['res.company'].create({'name': 'Telecom Lookup Company'})
+        self.telecom_service.company_id = self.env.company
+        self.assertEqual(ProductTemplate._get_telecom_service_id(self.telecom_service.id), self.telecom_service.id)
+        self.assertFalse(
+            ProductTemplate.with_company(company).with_context(allowed_company_ids=company.ids)._get_telecom_service_id(self.telecom_service.id),
+            "Lookups should be cached per set of allowed companies"
+        )
+
+        other_template = ProductTemplate.create({'name': 'Telecom lookup other product', 'categ_id': self.env.ref('product.product_category_all').id})
+        with patch.object(type(ProductTemplate), 'clear_caches') as clear_caches:
+            other_template.name = 'Telecom lookup other product renamed'
+            other_template.unlink()
+            clear_caches.assert_not_called()
+            self.telecom_service.name = 'Mobile data renamed'
+            clear_caches.assert_called()
+
+    def test_api_metrics(self):
+        self.env['ir.config_parameter'].sudo().set_param(metrics.METRICS_ENABLED_PARAM, 'True')
+        self.env['telecom.api.service'].get_consumption(self.consumption_1.id)
+
+        rendered = metrics.render()
+        self.assertIn('telecom_api_duration_seconds_count{operation="get_consumption",phase="total"}', rendered)
+        self.assertIn('telecom_api_sql_queries_total{operation="get_consumption",phase="read"}', rendered)
+
+        self.assertFalse(metrics.is_authorized(self.env, 'Bearer '), "Metrics should be disabled without a token")
+        self.env['ir.config_parameter'].sudo().set_param(metrics.METRICS_TOKEN_PARAM, 'metrics-secret')
+        self.assertTrue(metrics.is_authorized(self.env, 'Bearer metrics-secret'))
+        self.assertFalse(metrics.is_authorized(self.env, 'Bearer other-secret'))
+        self.assertFalse(metrics.is_authorized(self.env, None))
+
+        key = ('create_consumption_batch', 'validation')
+        count = metrics._metrics.get(key, {}).get('count', 0)
+        self.env['telecom.api.service'].create_consumption_batch([self.telecom_service_consumption_data] * 3)
+        self.assertEqual(metrics._metrics[key]['count'], count + 1, "The batch validation should be measured once")
+
+    def test_create_consumption_idempotent(self):
+        ApiService = self.env['telecom.api.service']
+        vals = {
+            'product_tmpl_id': self.telecom_service.id,
+            'consumption_timestamp': datetime.now().isoformat(),
+            'consumption_qty': 4,
+            'client_reference': 'collector-1-0001',
+        }
+        first = ApiService.create_consumption(**dict(vals))
+        retry = ApiService.create_consumption(**dict(vals))
+        self.assertEqual(first[0]['id'], retry[0]['id'], "A retried creation should return the existing consumption")
+
+        results = ApiService.create_consumption_batch([
+            dict(vals),
+            dict(vals, client_reference='collector-1-0002'),
+            dict(vals, client_reference='collector-1-0002'),
+        ])
+        self.assertEqual(results[0]['id'], first[0]['id'])
+        self.assertTrue(results[0]['duplicate'])
+        self.assertNotIn('duplicate', results[1])
+        self.assertEqual(results[2]['id'], results[1]['id'], "Repeated references in a batch should be created once")
+        self.assertEqual(self.telecom_service_consumption.search_count([('client_reference', 'like', 'collector-1-%')]), 2)
+
+    def test_create_consumption_idempotent_conflict(self):
+        ApiService = self.env['telecom.api.service']
+        vals = {
+            'product_tmpl_id': self.telecom_service.id,
+            'consumption_timestamp': '2001-01-01T00:00:00',
+            'consumption_qty': 4,
+            'client_reference': 'collector-conflict-0001',
+        }
+
+        def cleanup():
+            with self.registry.cursor() as cr:
+                cr.execute('DELETE FROM telecom_service_consumption WHERE client_reference = %s', (vals['client_reference'],))
+                cr.execute(
+                    'DELETE FROM telecom_service_usage_delta WHERE product_tmpl_id = %s AND consumption_timestamp = %s',
+                    (self.telecom_service.id, '2001-01-01 00:00:00')
+                )
+        self.addCleanup(cleanup)
+
+        # A concurrent transaction commits the reference after the test transaction took its snapshot
+        with self.registry.cursor() as cr:
+            concurrent = api.Environment(cr, self.env.uid, {})['telecom.api.service'].create_consumption(**dict(vals))
+
+        with self.assertRaises(errors.SerializationFailure) as error:
+            ApiService.create_consumption(**dict(vals))
+        self.assertEqual(error.exception.pgcode, errorcodes.SERIALIZATION_FAILURE, "Odoo should retry the request")
+
+        # The retried request runs in a new transaction, which finds the reference
+        with self.registry.cursor() as cr:
+            retry = api.Environment(cr, self.env.uid, {})['telecom.api.service'].create_consumption(**dict(vals))
+        self.assertEqual(retry[0]['id'], concurrent[0]['id'])
+
+    def test_create_consumption_async(self):
+        ApiService = self.env['telecom.api.service']
+        accepted = ApiService.create_consumption_async([
+            {
+                'product_tmpl_id': self.telecom_service.id,
+                'consumption_timestamp': datetime.now().isoformat(),
+                'consumption_qty': 8,
+            },
+            {
+                'product_tmpl_id': self.telecom_service.id,
+                'consumption_timestamp': 'not a date',
+                'consumption_qty': 8,
+            },
+        ])
+        self.assertEqual(ApiService.get_ticket_status(accepted['ticket'])['state'], 'pending')
+
+        self.env['telecom.service.consumption.staging']._process_staging()
+
+        status = ApiService.get_ticket_status(accepted['ticket'])
+        self.assertEqual(status['state'], 'done')
+        self.assertEqual([item['state'] for item in status['items']], ['done', 'error'])
+        self.assertEqual(self.telecom_service_consumption.browse(status['items'][0]['id']).consumption_qty, 8)
+
+    def test_consumption_retention(self):
+        old_consumption = self.telecom_service_consumption.create(dict(
+            self.telecom_service_consumption_data,
+            consumption_timestamp=datetime.now() - timedelta(days=120),
+        ))
+        old_date = old_consumption.consumption_timestamp.date()
+        self.env['ir.config_parameter'].sudo().set_param('somit_telecom.consumption_retention_months', 2)
+        self.env['telecom.service.usage.delta']._flush_deltas()
+
+        self.telecom_service_consumption._apply_retention()
+
+        self.assertFalse(old_consumption.exists(), "Consumptions older than the retention should be removed")
+        self.assertTrue(self.consumption_1.exists(), "Recent consumptions should be kept")
+        self.assertTrue(self.env['telecom.service.consumption.daily'].search([
+            ('consumption_date', '=', old_date),
+        ]), "Daily totals should keep their history")
+
+        retained_from = self.telecom_service_consumption._get_retained_from()
+        self.assertGreater(retained_from, old_date)
+        self.env['telecom.service.consumption.daily'].rebuild()
+        self.assertTrue(self.env['telecom.service.consumption.daily'].search([
+            ('consumption_date', '=', old_date),
+        ]), "Rebuilding should not remove the history of the removed consumptions")
+
+    def test_consumption_list_filters(self):
+        ApiService = self.env['telecom.api.service']
+        self.telecom_service_consumption.create(dict(self.telecom_service_consumption_data, consumption_qty=500))
+        records = ApiService.get_consumption_list(
+            limit=100,
+            product_tmpl_id=self.telecom_service.id,
+            category_code=[self.telecom_service.categ_id.code],
+            qty_min=100,
+            date_to=datetime.now().isoformat(),
+        )
+
+        self.assertTrue(records)
+        self.assertTrue(all(record['consumption_qty'] >= 100 for record in records))
+        self.assertTrue(all(record['product_tmpl_id'][0] == self.telecom_service.id for record in records))
+        with self.assertRaises(UserError):
+            ApiService.get_consumption_list(qty_min='many')
+
+    def test_consumption_list_count(self):
+        ApiService = self.env['telecom.api.service']
+        result = ApiService.get_consumption_list(limit=1, product_tmpl_id=self.telecom_service.id, count='exact')
+        self.assertEqual(result['total'], self.telecom_service_consumption.search_count([('product_tmpl_id', '=', self.telecom_service.id)]))
+        self.assertEqual(result['total_mode'], 'exact')
+        self.assertEqual(len(result['records']), 1)
+
+        result = ApiService.get_consumption_list(limit=1, count='estimate', pagination='cursor')
+        self.assertEqual(result['total_mode'], 'estimate')
+        self.assertIsInstance(result['total'], int)
+
+    def test_consumption_list_count_cursor(self):
+        ApiService = self.env['telecom.api.service']
+        self.telecom_service_consumption.create([self.telecom_service_consumption_data] * 2)
+        total = self.telecom_service_consumption.search_count([('product_tmpl_id', '=', self.telecom_service.id)])
+
+        params = {'limit': 1, 'product_tmpl_id': self.telecom_service.id, 'count': 'exact', 'pagination': 'cursor'}
+        first_page = ApiService.get_consumption_list(**params)
+        second_page = ApiService.get_consumption_list(cursor=first_page['next_cursor'], **params)
+        self.assertEqual(first_page['total'], total)
+        self.assertEqual(second_page['total'], total, "The total should not depend on the page")
+        self.assertNotEqual(first_page['records'][0]['id'], second_page['records'][0]['id'])
+
+    def test_consumption_etag(self):
+        ApiService = self.env['telecom.api.service']
+        etag, result = ApiService.get_consumption(self.consumption_1.id, with_etag=True)
+        self.assertTrue(result)
+
+        self.assertEqual(ApiService.get_consumption(self.consumption_1.id, if_none_match=etag, with_etag=True), (etag, None))
+
+        self.consumption_1.write({'consumption_qty': 11})
+        self.env.cr.execute(
+            "UPDATE telecom_service_consumption SET write_date = write_date + interval '1 second' WHERE id = %s",
+            (self.consumption_1.id,)
+        )
+        new_etag, result = ApiService.get_consumption(self.consumption_1.id, if_none_match=etag, with_etag=True)
+        self.assertNotEqual(new_etag, etag, "Updated consumptions should get a new ETag")
+        self.assertEqual(result[0]['consumption_qty'], 11)
+
+        etag, result = ApiService.get_consumption_list(limit=5, with_etag=True)
+        self.assertIsNone(ApiService.get_consumption_list(limit=5, if_none_match=etag, with_etag=True)[1])
+
+        # The display names of the templates are part of the list
+        etag, result = ApiService.get_consumption_list(limit=5, product_tmpl_id=self.telecom_service.id, with_etag=True)
+        self.telecom_service.name = 'Mobile data renamed'
+        new_etag, result = ApiService.get_consumption_list(limit=5, product_tmpl_id=self.telecom_service.id, if_none_match=etag, with_etag=True)
+        self.assertNotEqual(new_etag, etag, "Renaming the template should change the ETag")
+        self.assertEqual(result[0]['product_tmpl_id'][1], self.telecom_service.display_name)
+
+    def test_bulk_update_and_delete(self):
+        ApiService = self.env['telecom.api.service']
+        consumptions = self.telecom_service_consumption.create([dict(self.telecom_service_consumption_data) for _ in range(3)])
+        missing_id = max(consumptions.ids) + 1000
+
+        result = ApiService.update_consumptions(ids=consumptions.ids + [missing_id], values={'consumption_qty': 33})
+        self.assertEqual(result, {'updated': 3, 'missing_ids': [missing_id]})
+        self.assertEqual(set(consumptions.mapped('consumption_qty')), {33})
+
+        result = ApiService.delete_consumptions(filters={'qty_min': 33, 'qty_max': 33, 'product_tmpl_id': self.telecom_service.id})
+        self.assertEqual(result['deleted'], 3)
+        self.assertFalse(consumptions.exists())
+
+        with self.assertRaises(UserError):
+            ApiService.delete_consumptions(filters={})
+
+    def test_api_token(self):
+        ApiToken = self.env['telecom.api.token']
+        token = ApiToken.generate_token(self.env.uid)['token']
+        self.assertEqual(ApiToken.verify_token(token), self.env.uid)
+        with self.assertQueryCount(0):
+            self.assertEqual(ApiToken.verify_token(token), self.env.uid, "Verified tokens should be cached")
+
+        payload, signature = token.split('.')
+        with self.assertRaises(AccessDenied):
+            ApiToken.verify_token('%s.%s' % (payload, signature[::-1]))
+
+    def test_api_token_revocation(self):
+        ApiToken = self.env['telecom.api.token']
+        user = self.env['res.users'].create({
+            'name': 'Telecom API Token User',
+            'login': 'telecom_api_token_user',
+            'password': 'telecom-api-token-password-1',
+        })
+
+        token = ApiToken.generate_token(user.id)['token']
+        self.assertEqual(ApiToken.verify_token(token), user.id)
+        user.write({'password': 'telecom-api-token-password-2'})
+        with self.assertRaises(AccessDenied):
+            ApiToken.verify_token(token)
+
+        token, other_token = ApiToken.generate_token(user.id)['token'], ApiToken.generate_token(user.id)['token']
+        self.assertTrue(ApiToken.revoke_token(token))
+        with self.assertRaises(AccessDenied):
+            ApiToken.verify_token(token)
+        self.assertEqual(ApiToken.verify_token(other_token), user.id, "Other tokens of the user should keep working")
+
+        token = ApiToken.generate_token(user.id)['token']
+        self.assertEqual(ApiToken.verify_token(token), user.id)
+        user.active = False
+        with self.assertRaises(AccessDenied):
+            ApiToken.verify_token(token)
+
+    def test_import_consumptions(self):
+        ConsumptionImport = self.env['telecom.consumption.import']
+        ConsumptionDaily = self.env['telecom.service.consumption.daily']
+        UsageDelta = self.env['telecom.service.usage.delta']
+        UsageDelta._flush_deltas()
+        domain = [('product_tmpl_id', '=', self.telecom_service.id), ('company_id', '=', self.env.company.id)]
+        qty = sum(ConsumptionDaily.search(domain).mapped('consumption_qty'))
+        count = self.telecom_service_consumption.search_count(domain)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('telecom_service_name,consumption_timestamp,consumption_qty\n')
+            f.write('%s,2020-01-01T10:00:00,5\n' % self.telecom_service.name)
+            f.write('%s,01/02/2020 10:00:00,3\n' % self.telecom_service.name)
+            f.write('Unknown service,2020-01-01T10:00:00,5\n')
+            f.write('%s,2020-01-01T10:00:00,0\n' % self.telecom_service.name)
+            f.flush()
+            imported, errors = ConsumptionImport.import_file(f.name, chunk_size=1)
+
+        self.assertEqual(imported, 2)
+        self.assertEqual([number for number, error in errors], [4, 5], "Invalid rows should be reported by row number")
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('telecom_service_name,consumption_timestamp,consumption_qty,company_id\n')
+            f.write('%s,2020-01-01T11:00:00,1,not-a-company\n' % self.telecom_service.name)
+            f.write('%s,2020-01-01T11:00:00,1,%s\n' % (self.telecom_service.name, max(self.env['res.company'].search([]).ids) + 1000))
+            f.flush()
+            company_imported, company_errors = ConsumptionImport.import_file(f.name)
+        self.assertEqual(company_imported, 0)
+        self.assertEqual(company_errors, [(2, 'Unknown company'), (3, 'Unknown company')], "Unknown companies should be reported, not abort the import")
+        self.assertEqual(self.telecom_service_consumption.search_count(domain), count + 2)
+
+        consumption = self.telecom_service_consumption.search(domain + [('consumption_timestamp', '=', '2020-01-01 10:00:00')], limit=1)
+        self.assertEqual(consumption.category_code, self.telecom_service.categ_id.code)
+        self.assertEqual(consumption.name, '%s - 2020-01-01 10:00:00' % self.telecom_service.name)
+        UsageDelta._flush_deltas()
+        self.assertEqual(sum(ConsumptionDaily.search(domain).mapped('consumption_qty')), qty + 8, "Imported rows should be added to the daily totals")
+
+    def test_usage_counters(self):
+        UsageDelta = self.env['telecom.service.usage.delta']
+        UsageDelta._flush_deltas()
+        self.telecom_service._recompute_usage_counters()
+        qty, period_qty = self.telecom_service.telecom_consumption_qty, self.telecom_service.telecom_period_consumption_qty
+
+        timestamp = datetime.now().replace(microsecond=0)
+        consumption = self.telecom_service_consumption.create(dict(self.telecom_service_consumption_data, consumption_timestamp=timestamp, consumption_qty=7))
+        self.assertEqual(self.telecom_service.telecom_consumption_qty, qty, "Counters should only change when the deltas are flushed")
+
+        UsageDelta._flush_deltas()
+        self.assertEqual(self.telecom_service.telecom_consumption_qty, qty + 7)
+        self.assertEqual(self.telecom_service.telecom_period_consumption_qty, period_qty + 7)
+        self.assertEqual(self.telecom_service.telecom_last_consumption, timestamp)
+
+        consumption.write({'consumption_qty': 2})
+        UsageDelta._flush_deltas()
+        self.assertEqual(self.telecom_service.telecom_consumption_qty, qty + 2)
+
+        consumption.unlink()
+        UsageDelta._flush_deltas()
+        self.assertEqual(self.telecom_service.telecom_consumption_qty, qty)
+        self.assertLess(self.telecom_service.telecom_last_consumption or datetime.min, timestamp)
+
+        self.telecom_service._recompute_usage_counters()
+        self.assertEqual(
+            (self.telecom_service.telecom_consumption_qty, self.telecom_service.telecom_period_consumption_qty), (qty, period_qty),
+            "Recompute should match the incremental counters"
+        )
+
+    def test_consumption_list_compact(self):
+        ApiService = self.env['telecom.api.service']
+        records = ApiService.get_consumption_list(limit=5)
+        compact = ApiService.get_consumption_list(limit=5, row_format='compact')
+
+        self.assertEqual(compact['columns']['id'], [record['id'] for record in records])
+        self.assertEqual(compact['columns']['product_tmpl_id'], [record['product_tmpl_id'][0] for record in records])
+        for record in records:
+            self.assertEqual(compact['names']['product_tmpl_id'][record['product_tmpl_id'][0]], record['product_tmpl_id'][1])
+        with self.assertRaises(UserError):
+            ApiService.get_consumption_list(row_format='columns')
+
+    def test_compression(self):
+        body = json.dumps({'jsonrpc': '2.0', 'params': {'consumptions': [self.telecom_service_consumption_data] * 100}}, default=str).encode()
+        for encoding in compression.get_encodings():
+            self.assertEqual(compression.decompress(compression.compress(body, encoding), encoding), body)
+            self.assertEqual(compression.negotiate('%s, identity' % encoding), encoding)
+        self.assertFalse(compression.negotiate('gzip;q=0, br'))
+
+        etag = '"0123456789abcdef"'
+        self.assertEqual(compression.encode_etag(etag, 'gzip'), '"0123456789abcdef-gzip"')
+        self.assertEqual(compression.match_etag(etag, '"other", "0123456789abcdef-gzip"'), '"0123456789abcdef-gzip"')
+        self.assertEqual(compression.match_etag(etag, 'W/"0123456789abcdef"'), 'W/"0123456789abcdef"')
+        self.assertFalse(compression.match_etag(etag, '"0123456789abcdef-br"'))
+        self.assertTrue(self.env['telecom.api.service']._is_not_modified(etag, compression.encode_etag(etag, 'gzip')))
+        with self.assertRaises(ValueError):
+            compression.decompress(compression.compress(body, 'gzip')[:50], 'gzip')
+        with self.assertRaises(ValueError):
+            compression.decompress(body, 'br')